@@ -1,39 +1,219 @@
 import requests
-from flask import Flask, render_template, url_for, send_file, request, jsonify
-from urllib.parse import urljoin
+from flask import Flask, render_template, send_file, request, jsonify, Response
+from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 import os
 import random
 import socket
 import qrcode
+import qrcode.image.svg
 import io
+import mimetypes
 import json
 import sys
 import subprocess
 import re
+import hashlib
+import threading
+import heapq
+import atexit
+import time
+from collections import Counter, OrderedDict, deque
+from itertools import takewhile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # Import variables and functions from the new cache builder script
-from cache_builder import CACHE_DIRECTORY, SPECIES_FILE, load_species_from_file
+from cache_builder import CACHE_DIRECTORY, SPECIES_FILE, load_species_from_file, get_species_folder_name
 
 # --- Constants and Configuration ---
 BASE_URL = "http://localhost:8080/"
 API_ENDPOINT = "api/v2/detections/recent"
+# BirdNET-Go stations polled concurrently and merged into one display.
+# Each needs a unique 'name' (shown on the cards when there are several) and a 'url';
+# an optional 'timeout' overrides the detections endpoint policy for that station.
+STATIONS = [
+    {'name': 'Local', 'url': BASE_URL},
+]
+STATION_DEDUP_WINDOW = 10  # Seconds within which one species heard by two stations counts as one bird
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Accept': 'application/json'
 }
-PROXIES = {"http": None, "https": None}
+MIC_STATUS_URL = "http://10.42.0.50/api/status"
+NETWORK_PROBE_INTERVAL = 15  # Seconds between consolidated nmcli/ip probes (signal strength has no event)
+NETWORK_EVENT_DEBOUNCE = 1  # Seconds to let a burst of NetworkManager events settle before probing
+LOCAL_IP_REFRESH_INTERVAL = 60  # Seconds a resolved local IP is trusted without a network change
+QR_CACHE_SIZE = 8  # Rendered QR images kept in memory, keyed by URL and format
+DEFAULT_AP_INFO = {'ssid': 'Birdhost', 'password': 'birdnetpass', 'ip': '10.42.0.1'}
+UPSTREAM_POOL_SIZE = 8  # Keep-alive connections kept per upstream host
+# Per-endpoint (timeout seconds, retries after a connection error or 5xx)
+UPSTREAM_ENDPOINT_POLICIES = {
+    'detections': (10, 1),
+    'detections_probe': (2, 0),
+    'thumbnail_probe': (0.5, 0),
+    'thumbnail': (5, 1),
+    'mic_status': (2, 0),
+}
 SERVER_PORT = 5000
 PINNED_SPECIES_FILE = "pinned_species.json"
 PINNED_DURATION_HOURS = 24
+PINNED_FLUSH_DELAY = 2  # Seconds to coalesce pinned species changes before writing the file
+DETECTION_POLL_INTERVAL = 5  # Seconds between BirdNET-Go polls while birds are being detected
+IDLE_POLL_INTERVAL = 60  # Ceiling the poll interval backs off to when nothing new is detected
+POLL_BACKOFF_FACTOR = 1.5  # Growth of the poll interval per poll without a new detection
+ACTIVITY_WINDOW = 600  # Seconds of detections used to estimate the detection rate
+BUSY_DETECTION_RATE = 1.0  # Detections per minute that keep polling at full speed
+QUIET_HOURS = None  # Local (start, end) hours with sparse polling, e.g. (22, 5); None disables
+QUIET_HOURS_POLL_INTERVAL = 180  # Poll interval ceiling during quiet hours
+BACKGROUND_MAX_SCALE = 4  # Most the WiFi and microphone sample intervals are stretched while idle
+OFFLINE_POLL_INTERVAL = 30  # Seconds between polls while BirdNET-Go is unreachable
+MIC_SAMPLE_INTERVAL = 5  # Seconds between microphone status samples while it responds
+MIC_MAX_BACKOFF = 60  # Upper bound for the sample interval while the microphone is unreachable
+MIC_HISTORY_SIZE = 720  # Microphone samples kept for /api/audio/history (one hour at 5 s)
+STREAM_HEARTBEAT_SECONDS = 15  # Idle time before /stream sends a keep-alive comment
+STREAM_RETRY_MS = 5000  # Reconnect delay suggested to EventSource clients
+IMAGE_MANIFEST_CHECK_INTERVAL = 60  # Seconds between mtime checks of the offline image cache
+THUMBNAIL_PROBE_TTL = 900  # Seconds to trust that a BirdNET-Go thumbnail exists
+THUMBNAIL_PROBE_NEGATIVE_TTL = 120  # Seconds to remember that a thumbnail was unavailable
+THUMBNAIL_PROBE_CACHE_SIZE = 512  # Max species codes kept in the probe cache (LRU)
+IMAGE_VALIDATION_WORKERS = 4  # Concurrent thumbnail probes per refresh
+IMAGE_VALIDATION_DEADLINE = 1.0  # Seconds allowed for the whole image validation stage
+MAX_DISPLAYED_BIRDS = 4
+# Display order: ranking policies compared in turn, most recent detection breaking ties.
+# Policies: 'pinned' (pinned species first), 'recent', 'confidence' (best in window), 'frequency' (detections in window)
+RANKING_ORDER = ('pinned', 'recent')
+RANKING_CANDIDATE_LIMIT = 12  # Top-ranked species handed to image validation
+THUMBNAIL_CACHE_DIRECTORY = "thumbnail_cache"  # Local copies of BirdNET-Go species thumbnails
+THUMBNAIL_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Least recently used thumbnails are evicted beyond this
+THUMBNAIL_REVALIDATE_AFTER = 24 * 3600  # Seconds before a cached thumbnail is refreshed in the background
+THUMBNAIL_BROWSER_MAX_AGE = 7 * 24 * 3600  # Cache-Control max-age sent with /thumb responses
+SPECIES_CODE_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+DETECTION_BUFFER_SIZE = 200  # Recent detections kept in memory per station (and fetched on a full sync)
+INCREMENTAL_FETCH_LIMIT = 20  # Detections requested per poll once the buffer is primed
+DETECTION_RESYNC_INTERVAL = 600  # Seconds between full re-fetches of the detection window
+BREAKER_FAILURE_THRESHOLD = 3  # Consecutive detection fetch failures before the circuit opens
+BREAKER_RETRY_BASE = 5  # Seconds the circuit stays open before the first recovery probe
+BREAKER_RETRY_MAX = 300  # Cap for the doubling delay between failed recovery probes
 
 # --- Flask App Initialization ---
 app = Flask(__name__, template_folder='static')
 
 # --- Caching & Status Globals ---
-DETECTION_CACHE = { "id": None, "raw_data": [] }
+# Latest detection snapshot, replaced wholesale by the background poller.
+# Readers take a reference and never mutate it, so routes need no lock.
+_detection_snapshot = None
+_snapshot_lock = threading.Lock()
+_snapshot_ready = threading.Event()
+_refresh_requested = threading.Event()
+_poller_thread = None
+
+# Latest event per /stream topic; ids increase monotonically across topics
+_stream_condition = threading.Condition()
+_stream_event_id = 0
+_stream_events = {}
+
+# Offline image cache index: species folder -> {"mtime_ns", "images": [{"image_url", "copyright"}]}
+_image_manifest = {}
+_image_manifest_root_mtime = None
+_image_manifest_checked_at = 0
+_image_manifest_version = 0  # Bumped whenever the manifest contents change
+_image_manifest_lock = threading.Lock()
+
+# Offline rotation deck: species with cached images, dealt from a shuffled bag
+_offline_species = []  # (common name, scientific name, images) in species list order
+_offline_bag = []
+_offline_bag_position = 0
+_offline_deck_source = None  # (manifest version, species file mtime) the deck was built from
+_offline_deck_checked_at = 0
+_offline_deck_lock = threading.Lock()
+
+# Thumbnail probe results: species code -> (available, expires_at), in LRU order
+_thumbnail_probe_cache = OrderedDict()
+_thumbnail_probe_lock = threading.Lock()
+_thumbnail_probe_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_image_validation_pool = ThreadPoolExecutor(max_workers=IMAGE_VALIDATION_WORKERS, thread_name_prefix="image-probe")
+
+# Cached outbound IP; cleared by the network monitor or after a WiFi change
+_local_ip = None
+_local_ip_resolved_at = 0
+
+# Rendered QR codes: (url, format) -> (image bytes, etag), in LRU order
+_qr_cache = OrderedDict()
+_qr_cache_lock = threading.Lock()
+
+# Network state published by the network monitor; replaced wholesale on each probe
+_network_state = None
+_network_state_ready = threading.Event()
+_network_refresh_requested = threading.Event()
+_network_monitor_thread = None
+_network_monitor_lock = threading.Lock()
+
+# Microphone telemetry: fixed-size ring of samples, written in place by the mic sampler
+_mic_samples = [None] * MIC_HISTORY_SIZE
+_mic_sample_next = 0  # Slot the next sample is written to
+_mic_sample_count = 0
+_mic_sample_lock = threading.Lock()
+_mic_sample_ready = threading.Event()
+_mic_sampler_thread = None
+
+# Pooled keep-alive sessions, one per upstream host (BirdNET-Go, ESP32 mic)
+_upstream_sessions = {}
+_upstream_lock = threading.Lock()
+_upstream_endpoint_stats = {endpoint: {"requests": 0, "retries": 0, "errors": 0} for endpoint in UPSTREAM_ENDPOINT_POLICIES}
+
+# Recent detections from every station, newest first by detection time
+_detection_buffer = deque()
+_detection_buffer_lock = threading.Lock()
+_detection_fetch_lock = threading.Lock()  # Serializes refreshes; held across upstream calls, unlike the buffer lock
+
+# Per-station fetch and circuit breaker state, keyed by station name
+def _new_station_state(station):
+    return {
+        "name": station['name'], "url": station['url'], "timeout": station.get('timeout'),
+        "ids": set(),  # Identities of this station's detections in the buffer
+        "last_full_sync": 0,
+        "breaker": "closed",  # closed, open or half_open
+        "failures": 0,  # Consecutive failures while closed
+        "retry_delay": BREAKER_RETRY_BASE,
+        "retry_at": 0,  # Monotonic time of the next recovery probe while open
+        "last_success": None,
+        "last_latency": None,
+        "stats": {"full_syncs": 0, "incremental_fetches": 0, "gap_resyncs": 0, "new_detections": 0, "errors": 0,
+                  "transitions": {"closed": 0, "open": 0, "half_open": 0},
+                  "short_circuited": 0, "probes": 0, "probe_failures": 0},
+    }
+
+_stations = {station['name']: _new_station_state(station) for station in STATIONS}
+_breaker_lock = threading.Lock()
+_station_pool = ThreadPoolExecutor(max_workers=len(STATIONS), thread_name_prefix="station-fetch")
+
+# Adaptive poll scheduler: detection times in the activity window and the last decisions
+_activity_timestamps = deque()  # Epoch ms of fresh detections, oldest first
+_newest_detection_ms = None
+_fresh_since_decision = 0
+_poll_schedule = {"interval": DETECTION_POLL_INTERVAL, "reason": "startup", "rate": 0.0}
+_poll_schedule_lock = threading.Lock()
+_poll_schedule_log = deque(maxlen=50)  # Interval changes, newest last
+_poll_schedule_stats = {"polls": 0, "reasons": {}, "started_at": time.monotonic()}
+
+# Thumbnail disk cache: species code -> {"path", "mimetype", "size", "fetched_at", "etag"}, in LRU order
+_thumbnail_index = OrderedDict()
+_thumbnail_index_loaded = False
+_thumbnail_index_lock = threading.Lock()
+_thumbnail_cache_bytes = 0
+_thumbnail_inflight = {}  # species code -> Event set when its download finishes
+_thumbnail_cache_stats = {"hits": 0, "fetches": 0, "revalidations": 0, "evictions": 0, "errors": 0}
+_thumbnail_fetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumb-fetch")
 
 # --- Pinned Species Management ---
+# The pinned list lives in memory; the JSON file is read once and written behind
+_pinned_species = None  # species name -> {'pinned_until': iso str, 'dismissed': bool}
+_pinned_expiry_heap = []  # (pinned_until datetime, species name), may hold stale entries
+_pinned_lock = threading.Lock()
+_pinned_write_lock = threading.Lock()
+_pinned_flush_timer = None
+
 def load_pinned_species():
     """Load pinned species from JSON file."""
     if not os.path.exists(PINNED_SPECIES_FILE):
@@ -46,54 +226,107 @@ def load_pinned_species():
         return {}
 
 def save_pinned_species(pinned_data):
-    """Save pinned species to JSON file."""
+    """Save pinned species to JSON file atomically (temp file + rename)."""
+    tmp_path = f"{PINNED_SPECIES_FILE}.tmp"
     try:
-        with open(PINNED_SPECIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(pinned_data, f, indent=2)
+        with _pinned_write_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(pinned_data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, PINNED_SPECIES_FILE)
     except IOError as e:
         print(f"Error saving pinned species file: {e}")
 
+def flush_pinned_species():
+    """Write pending pinned species changes to disk."""
+    global _pinned_flush_timer
+    with _pinned_lock:
+        _pinned_flush_timer = None
+        if _pinned_species is None:
+            return
+        pinned_copy = {name: dict(data) for name, data in _pinned_species.items()}
+    save_pinned_species(pinned_copy)
+
+def _schedule_pinned_flush():
+    """Coalesce changes into one write PINNED_FLUSH_DELAY seconds out. Caller holds _pinned_lock."""
+    global _pinned_flush_timer
+    if _pinned_flush_timer is None:
+        _pinned_flush_timer = threading.Timer(PINNED_FLUSH_DELAY, flush_pinned_species)
+        _pinned_flush_timer.daemon = True
+        _pinned_flush_timer.start()
+
+def _ensure_pinned_loaded():
+    """Load the pinned file into memory on first use. Caller holds _pinned_lock."""
+    global _pinned_species
+    if _pinned_species is not None:
+        return
+    _pinned_species = {}
+    for species_name, data in load_pinned_species().items():
+        try:
+            pinned_until = datetime.fromisoformat(data['pinned_until'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        _pinned_species[species_name] = data
+        _pinned_expiry_heap.append((pinned_until, species_name))
+    heapq.heapify(_pinned_expiry_heap)
+
+def _expire_pinned_species(now):
+    """Drop entries whose pin has run out. Caller holds _pinned_lock."""
+    expired = False
+    while _pinned_expiry_heap and _pinned_expiry_heap[0][0] <= now:
+        pinned_until, species_name = heapq.heappop(_pinned_expiry_heap)
+        data = _pinned_species.get(species_name)
+        # Skip stale heap entries for species that were removed and pinned again
+        if data is not None and data['pinned_until'] == pinned_until.isoformat():
+            del _pinned_species[species_name]
+            expired = True
+    if expired:
+        _schedule_pinned_flush()
+
 def add_pinned_species(species_name):
     """Add a species to the pinned list with 24-hour expiration."""
-    pinned = load_pinned_species()
-    # Only add if not already present (dismissed or not)
-    if species_name not in pinned:
-        pinned[species_name] = {
-            'pinned_until': (datetime.now() + timedelta(hours=PINNED_DURATION_HOURS)).isoformat(),
-            'dismissed': False
-        }
-        save_pinned_species(pinned)
+    with _pinned_lock:
+        _ensure_pinned_loaded()
+        # Only add if not already present (dismissed or not)
+        if species_name not in _pinned_species:
+            pinned_until = datetime.now() + timedelta(hours=PINNED_DURATION_HOURS)
+            _pinned_species[species_name] = {
+                'pinned_until': pinned_until.isoformat(),
+                'dismissed': False
+            }
+            heapq.heappush(_pinned_expiry_heap, (pinned_until, species_name))
+            _schedule_pinned_flush()
 
 def dismiss_pinned_species(species_name):
     """Mark a pinned species as dismissed."""
-    pinned = load_pinned_species()
-    if species_name in pinned:
-        pinned[species_name]['dismissed'] = True
-        save_pinned_species(pinned)
-        return True
+    with _pinned_lock:
+        _ensure_pinned_loaded()
+        if species_name in _pinned_species:
+            _pinned_species[species_name]['dismissed'] = True
+            _schedule_pinned_flush()
+            return True
     return False
 
+def dismiss_all_pinned_species():
+    """Mark every pinned species as dismissed."""
+    with _pinned_lock:
+        _ensure_pinned_loaded()
+        for data in _pinned_species.values():
+            data['dismissed'] = True
+        _schedule_pinned_flush()
+
 def get_active_pinned_species():
     """Get list of currently active (not expired, not dismissed) pinned species."""
-    pinned = load_pinned_species()
-    active = {}
-    now = datetime.now()
+    with _pinned_lock:
+        _ensure_pinned_loaded()
+        _expire_pinned_species(datetime.now())
+        return {name: dict(data) for name, data in _pinned_species.items() if not data.get('dismissed', False)}
 
-    for species_name, data in list(pinned.items()):
-        pinned_until = datetime.fromisoformat(data['pinned_until'])
-        if not data.get('dismissed', False) and now < pinned_until:
-            active[species_name] = data
-        elif now >= pinned_until:
-            # Clean up expired entries
-            del pinned[species_name]
-
-    if len(pinned) != len(active):
-        save_pinned_species(pinned)
-
-    return active
+atexit.register(flush_pinned_species)
 
 # --- IP and QR Code Helpers ---
-def get_local_ip():
+def _resolve_local_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         s.connect(('10.255.255.255', 1))
@@ -104,136 +337,283 @@ def get_local_ip():
         s.close()
     return IP
 
-def get_interface_ip(interface):
-    """Get IP address for a specific network interface."""
-    try:
-        result = subprocess.run(
-            ['ip', 'addr', 'show', interface],
-            capture_output=True, text=True, timeout=5
-        )
-        # Parse output for inet address
-        match = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', result.stdout)
-        if match:
-            return match.group(1)
-    except Exception as e:
-        print(f"[INFO] Could not get IP for {interface}: {e}")
-    return None
-
-def is_wlan0_connected():
-    """Check if wlan0 is connected to a WiFi network."""
-    try:
-        result = subprocess.run(
-            ['nmcli', '-t', '-f', 'DEVICE,STATE', 'device', 'status'],
-            capture_output=True, text=True, timeout=5
-        )
-        for line in result.stdout.strip().split('\n'):
-            if line.startswith('wlan0:'):
-                state = line.split(':')[1]
-                return state == 'connected'
-    except Exception as e:
-        print(f"[INFO] Could not check wlan0 status: {e}")
-    return False
-
-def get_ap_info():
-    """Get Access Point information for wlan1."""
-    try:
-        # Get wlan1 IP address
-        wlan1_ip = get_interface_ip('wlan1')
-        if not wlan1_ip:
-            wlan1_ip = "10.42.0.1"  # Default AP IP
-
-        # Get AP SSID from NetworkManager connection
-        ssid = None
-        password = None
-
-        # Try to get active AP connection on wlan1
-        result = subprocess.run(
-            ['nmcli', '-t', '-f', 'NAME,DEVICE', 'connection', 'show', '--active'],
-            capture_output=True, text=True, timeout=5
-        )
-
-        ap_connection_name = None
-        for line in result.stdout.strip().split('\n'):
-            if 'wlan1' in line:
-                ap_connection_name = line.split(':')[0]
-                break
-
-        if ap_connection_name:
-            # Get SSID
-            result = subprocess.run(
-                ['nmcli', '-t', '-f', '802-11-wireless.ssid', 'connection', 'show', ap_connection_name],
-                capture_output=True, text=True, timeout=5
-            )
-            ssid_line = result.stdout.strip()
-            if ssid_line and ':' in ssid_line:
-                ssid = ssid_line.split(':', 1)[1]
-
-            # Get password
-            result = subprocess.run(
-                ['nmcli', '-s', '-t', '-f', '802-11-wireless-security.psk', 'connection', 'show', ap_connection_name],
-                capture_output=True, text=True, timeout=5
-            )
-            password_line = result.stdout.strip()
-            if password_line and ':' in password_line:
-                password = password_line.split(':', 1)[1]
-
-        return {
-            'ssid': ssid or 'Birdhost',
-            'password': password or 'birdnetpass',
-            'ip': wlan1_ip
-        }
-    except Exception as e:
-        print(f"[INFO] Could not get AP info: {e}")
-        return {
-            'ssid': 'Birdhost',
-            'password': 'birdnetpass',
-            'ip': '10.42.0.1'
-        }
-
-@app.route('/qr_code.png')
-def qr_code():
-    ip = get_local_ip()
-    url = f"http://{ip}:8080"
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf)
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
-
-@app.route('/api/connection_info')
-def connection_info():
-    """Return connection information based on wlan0 status."""
-    wlan0_connected = is_wlan0_connected()
+def get_local_ip():
+    """Return the outbound IP, re-resolving only when invalidated or after LOCAL_IP_REFRESH_INTERVAL."""
+    global _local_ip, _local_ip_resolved_at
+    if _local_ip is None or time.monotonic() - _local_ip_resolved_at > LOCAL_IP_REFRESH_INTERVAL:
+        ip = _resolve_local_ip()
+        if _local_ip is not None and ip != _local_ip:
+            print(f"[INFO] Local IP changed from {_local_ip} to {ip}")
+        _local_ip, _local_ip_resolved_at = ip, time.monotonic()
+    return _local_ip
+
+def invalidate_local_ip():
+    """Force the next get_local_ip() call to re-resolve the address."""
+    global _local_ip_resolved_at
+    _local_ip_resolved_at = 0
+
+def get_connection_details():
+    """Describe how to reach this display: BirdNET-Go via wlan0, or the display via the AP."""
+    state = get_network_state()
+    wlan0_connected = state is not None and state['wlan0']['state'] == 'connected'
 
     if wlan0_connected:
         # Normal mode - show regular IP and QR
         ip = get_local_ip()
-        return jsonify({
+        return {
             'mode': 'connected',
             'ip': ip,
             'url': f"http://{ip}:8080"
-        })
+        }
     else:
         # AP mode - show AP details
-        ap_info = get_ap_info()
-        return jsonify({
+        ap_info = state['ap'] if state is not None else DEFAULT_AP_INFO
+        return {
             'mode': 'ap',
             'ssid': ap_info['ssid'],
             'password': ap_info['password'],
             'ip': ap_info['ip'],
             'url': f"http://{ap_info['ip']}:5000"
-        })
+        }
+
+def render_qr_code(url, image_format):
+    """Return (bytes, etag) for a QR code of url, rendering it only on a cache miss."""
+    key = (url, image_format)
+    with _qr_cache_lock:
+        cached = _qr_cache.get(key)
+        if cached is not None:
+            _qr_cache.move_to_end(key)
+            return cached
+
+    if image_format == 'svg':
+        img = qrcode.make(url, image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qrcode.make(url)
+    buf = io.BytesIO()
+    img.save(buf)
+    rendered = (buf.getvalue(), hashlib.sha1(buf.getvalue()).hexdigest())
+
+    with _qr_cache_lock:
+        _qr_cache[key] = rendered
+        while len(_qr_cache) > QR_CACHE_SIZE:
+            _qr_cache.popitem(last=False)
+    return rendered
+
+def _qr_code_response(image_format, mimetype):
+    data, etag = render_qr_code(get_connection_details()['url'], image_format)
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    # The address can change under the same path, so browsers revalidate (cheap 304s)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/qr_code.png')
+def qr_code():
+    return _qr_code_response('png', 'image/png')
+
+@app.route('/qr_code.svg')
+def qr_code_svg():
+    return _qr_code_response('svg', 'image/svg+xml')
+
+@app.route('/api/connection_info')
+def connection_info():
+    """Return connection information based on wlan0 status."""
+    return jsonify(get_connection_details())
+
+# --- Network State Monitor ---
+def _run_nmcli(args):
+    """Run a command and return its stdout, or '' if it fails."""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=5)
+        return result.stdout if result.returncode == 0 else ""
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[INFO] Could not run {args[0]}: {e}")
+        return ""
+
+def probe_network_state(previous=None):
+    """Collect wlan0/wlan1 state, IPs, wlan0 signal and AP credentials in one pass."""
+    interfaces = {name: {'state': 'unavailable', 'connection': None, 'ip': None} for name in ('wlan0', 'wlan1')}
+    for line in _run_nmcli(['nmcli', '-t', '-f', 'DEVICE,STATE,CONNECTION', 'device', 'status']).splitlines():
+        parts = line.split(':', 2)
+        if len(parts) == 3 and parts[0] in interfaces:
+            interfaces[parts[0]]['state'] = parts[1]
+            interfaces[parts[0]]['connection'] = parts[2] if parts[2] and parts[2] != '--' else None
+
+    for match in re.finditer(r'^\d+:\s+(\S+)\s+inet\s+(\d+\.\d+\.\d+\.\d+)', _run_nmcli(['ip', '-4', '-o', 'addr', 'show']), re.M):
+        if match.group(1) in interfaces and not interfaces[match.group(1)]['ip']:
+            interfaces[match.group(1)]['ip'] = match.group(2)
+
+    signal = None
+    if interfaces['wlan0']['state'] == 'connected':
+        # --rescan no: report the last scan instead of triggering a new one
+        for line in _run_nmcli(['nmcli', '-t', '-f', 'ACTIVE,SIGNAL', 'dev', 'wifi', 'list', 'ifname', 'wlan0', '--rescan', 'no']).splitlines():
+            if line.startswith('yes:') and line.split(':')[1].strip().isdigit():
+                signal = int(line.split(':')[1])
+                break
+    interfaces['wlan0']['signal'] = signal
+
+    # AP credentials only change with the wlan1 connection, so reuse them until it does
+    ap_connection = interfaces['wlan1']['connection']
+    if previous is not None and previous['wlan1']['connection'] == ap_connection:
+        ap = dict(previous['ap'], ip=interfaces['wlan1']['ip'] or DEFAULT_AP_INFO['ip'])
+    else:
+        ap = dict(DEFAULT_AP_INFO, ip=interfaces['wlan1']['ip'] or DEFAULT_AP_INFO['ip'])
+        if ap_connection:
+            output = _run_nmcli(['nmcli', '-s', '-t', '-f', '802-11-wireless.ssid,802-11-wireless-security.psk',
+                                 'connection', 'show', ap_connection])
+            for line in output.splitlines():
+                key, _, value = line.partition(':')
+                if key == '802-11-wireless.ssid' and value:
+                    ap['ssid'] = value
+                elif key == '802-11-wireless-security.psk' and value:
+                    ap['password'] = value
+
+    return {'wlan0': interfaces['wlan0'], 'wlan1': interfaces['wlan1'], 'ap': ap, 'updated_at': time.time()}
+
+def _network_monitor_loop():
+    global _network_state
+    while True:
+        try:
+            previous = _network_state
+            _network_state = probe_network_state(previous)
+            _network_state_ready.set()
+            if previous is not None and any(previous[name]['ip'] != _network_state[name]['ip'] for name in ('wlan0', 'wlan1')):
+                invalidate_local_ip()
+            publish_stream_event('wifi', fetch_wifi_signal())
+        except Exception as e:
+            print(f"[ERROR] Network monitor failed: {e}")
+        if _network_refresh_requested.wait(background_interval(NETWORK_PROBE_INTERVAL)):
+            time.sleep(NETWORK_EVENT_DEBOUNCE)
+        _network_refresh_requested.clear()
+
+def _network_event_listener():
+    """Wake the network monitor whenever NetworkManager reports a change."""
+    while True:
+        try:
+            process = subprocess.Popen(['nmcli', 'monitor'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError as e:
+            print(f"[INFO] nmcli monitor unavailable, using periodic network probes only: {e}")
+            return
+        for _ in process.stdout:
+            _network_refresh_requested.set()
+        process.wait()
+        # NetworkManager restarted or nmcli exited; reconnect after a pause
+        time.sleep(NETWORK_PROBE_INTERVAL)
+
+def request_network_refresh():
+    """Ask the network monitor to re-probe now, e.g. after changing WiFi."""
+    _network_refresh_requested.set()
+
+def start_network_monitor():
+    """Start the network monitor and its nmcli event listener (idempotent)."""
+    global _network_monitor_thread
+    with _network_monitor_lock:
+        if _network_monitor_thread is not None:
+            return
+        _network_monitor_thread = threading.Thread(target=_network_monitor_loop, name="network-monitor", daemon=True)
+        _network_monitor_thread.start()
+        threading.Thread(target=_network_event_listener, name="network-events", daemon=True).start()
+
+def get_network_state():
+    """Return the latest network state, or None if the first probe has not finished."""
+    if _network_state is None:
+        start_network_monitor()
+        _network_state_ready.wait(timeout=10)
+    return _network_state
+
+# --- Microphone Telemetry Sampler ---
+def sample_mic_status():
+    """Query the ESP32 microphone once and return a telemetry sample."""
+    sample = {"time": time.time(), "reachable": False, "streaming": False, "rssi": 0,
+              "last_rtsp_connect": None, "last_stream_start": None}
+    try:
+        response = upstream_request('GET', 'mic_status', MIC_STATUS_URL)
+        response.raise_for_status()
+        status_data = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return sample
+    if not isinstance(status_data, dict):
+        return sample
+    sample.update(
+        reachable=True,
+        streaming=status_data.get("streaming") is True,
+        rssi=status_data.get("wifi_rssi", 0),  # Default to 0 if the firmware omits it
+        last_rtsp_connect=status_data.get("last_rtsp_connect"),
+        last_stream_start=status_data.get("last_stream_start"),
+    )
+    return sample
+
+def _record_mic_sample(sample):
+    global _mic_sample_next, _mic_sample_count
+    with _mic_sample_lock:
+        _mic_samples[_mic_sample_next] = sample
+        _mic_sample_next = (_mic_sample_next + 1) % MIC_HISTORY_SIZE
+        _mic_sample_count = min(_mic_sample_count + 1, MIC_HISTORY_SIZE)
+    _mic_sample_ready.set()
+
+def _mic_sampler_loop():
+    interval = MIC_SAMPLE_INTERVAL
+    was_reachable = True
+    while True:
+        try:
+            sample = sample_mic_status()
+            _record_mic_sample(sample)
+            status = fetch_audio_status(sample)
+            publish_stream_event('audio', status, key=(status["connected"], status["rssi"]))
+            if sample["reachable"]:
+                interval = background_interval(MIC_SAMPLE_INTERVAL)
+            else:
+                if was_reachable:
+                    print("[INFO] Microphone status unavailable")
+                # Back off while the ESP32 is off the network
+                interval = min(interval * 2, MIC_MAX_BACKOFF)
+            was_reachable = sample["reachable"]
+        except Exception as e:
+            print(f"[ERROR] Mic sampler failed: {e}")
+        time.sleep(interval)
+
+def start_mic_sampler():
+    """Start the background microphone sampler (idempotent)."""
+    global _mic_sampler_thread
+    with _mic_sample_lock:
+        if _mic_sampler_thread is not None:
+            return
+        _mic_sampler_thread = threading.Thread(target=_mic_sampler_loop, name="mic-sampler", daemon=True)
+        _mic_sampler_thread.start()
+
+def get_latest_mic_sample():
+    """Return the newest microphone sample, waiting briefly for the first one."""
+    if _mic_sample_count == 0:
+        start_mic_sampler()
+        _mic_sample_ready.wait(timeout=3)
+    with _mic_sample_lock:
+        if _mic_sample_count == 0:
+            return None
+        return _mic_samples[(_mic_sample_next - 1) % MIC_HISTORY_SIZE]
+
+def get_mic_history():
+    """Return copies of the buffered microphone samples, oldest first."""
+    with _mic_sample_lock:
+        start = (_mic_sample_next - _mic_sample_count) % MIC_HISTORY_SIZE
+        return [dict(_mic_samples[(start + i) % MIC_HISTORY_SIZE]) for i in range(_mic_sample_count)]
+
+def fetch_audio_status(sample):
+    """Summarise a microphone sample for the status indicator."""
+    if sample is None:
+        return {"connected": False, "rssi": 0}
+    return {"connected": sample["streaming"], "rssi": sample["rssi"],
+            "last_rtsp_connect": sample["last_rtsp_connect"], "last_stream_start": sample["last_stream_start"],
+            "updated_at": sample["time"]}
 
 # --- Time Helper Functions ---
-def parse_absolute_time_to_seconds_ago(time_str):
-    if not time_str: return 0
+def parse_detection_timestamp_ms(time_str):
+    """Convert a BirdNET-Go local "YYYY-MM-DD HH:MM:SS" time to epoch milliseconds, or None."""
+    if not time_str: return None
     try:
         time_format = "%Y-%m-%d %H:%M:%S"
-        detection_time = datetime.strptime(time_str, time_format)
-        time_difference = datetime.now() - detection_time
-        return max(0, time_difference.total_seconds())
-    except (ValueError, TypeError):
-        return 0
+        return int(datetime.strptime(time_str, time_format).timestamp() * 1000)
+    except (ValueError, TypeError, OverflowError):
+        return None
 
 def format_seconds_ago(total_seconds):
     if total_seconds < 60: return f"{int(total_seconds)}s ago"
@@ -243,213 +623,1127 @@ def format_seconds_ago(total_seconds):
     if hours < 24: return f"{int(hours)}h ago"
     return f"{int(hours / 24)}d ago"
 
+# --- Upstream HTTP Client ---
+def get_upstream_session(url):
+    """Get or create the keep-alive session for the host of url."""
+    host = urlparse(url).netloc
+    with _upstream_lock:
+        session = _upstream_sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            session.trust_env = False  # Upstreams are local; never route them through a proxy
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _upstream_sessions[host] = session
+    return session
+
+def upstream_request(method, endpoint, url, **kwargs):
+    """Send a request over the pooled session using the endpoint's timeout and retry policy.
+
+    A non-None timeout keyword overrides the policy timeout.
+    """
+    timeout, retries = UPSTREAM_ENDPOINT_POLICIES[endpoint]
+    if kwargs.get('timeout') is None:
+        kwargs.pop('timeout', None)
+    else:
+        timeout = kwargs.pop('timeout')
+    session = get_upstream_session(url)
+    stats = _upstream_endpoint_stats[endpoint]
+    for attempt in range(retries + 1):
+        with _upstream_lock:
+            stats["requests"] += 1
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            if response.status_code < 500 or attempt == retries:
+                return response
+            # Discarded 5xx: release its connection back to the pool before retrying
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # A timeout already cost the full budget, so only fast failures are retried
+            # (ConnectTimeout is both a ConnectionError and a Timeout)
+            if attempt == retries or isinstance(e, requests.exceptions.Timeout):
+                with _upstream_lock:
+                    stats["errors"] += 1
+                raise
+        with _upstream_lock:
+            stats["retries"] += 1
+
+def get_upstream_stats():
+    """Report per-endpoint request counts and per-host connection reuse."""
+    hosts = {}
+    with _upstream_lock:
+        endpoints = {endpoint: dict(counts) for endpoint, counts in _upstream_endpoint_stats.items()}
+        sessions = list(_upstream_sessions.items())
+    for host, session in sessions:
+        opened = sent = 0
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        hosts[host] = {"requests": sent, "connections_opened": opened, "connections_reused": max(0, sent - opened)}
+    return {"hosts": hosts, "endpoints": endpoints}
+
 # --- Data Parsing and API Helpers ---
 def check_image_url_fast(url):
     """Quick check if an image URL is accessible with very short timeout."""
     try:
-        response = requests.head(url, timeout=0.5)
+        response = upstream_request('HEAD', 'thumbnail_probe', url)
         return response.status_code == 200
     except requests.exceptions.RequestException:
         return False
 
-def parse_v2_detection_item(detection, server_ip):
+def check_thumbnail_cached(species_code, url):
+    """Probe a BirdNET-Go thumbnail, remembering the result per species code.
+
+    Hits and misses are cached with separate TTLs so a missing thumbnail is
+    retried sooner than a working one is re-verified.
+    """
+    if is_thumbnail_cached(species_code):
+        return True
+    now = time.monotonic()
+    with _thumbnail_probe_lock:
+        cached = _thumbnail_probe_cache.get(species_code)
+        if cached is not None and cached[1] > now:
+            _thumbnail_probe_cache.move_to_end(species_code)
+            _thumbnail_probe_stats["hits"] += 1
+            return cached[0]
+        _thumbnail_probe_stats["misses"] += 1
+
+    available = check_image_url_fast(url)
+    ttl = THUMBNAIL_PROBE_TTL if available else THUMBNAIL_PROBE_NEGATIVE_TTL
+    with _thumbnail_probe_lock:
+        _thumbnail_probe_cache[species_code] = (available, time.monotonic() + ttl)
+        _thumbnail_probe_cache.move_to_end(species_code)
+        while len(_thumbnail_probe_cache) > THUMBNAIL_PROBE_CACHE_SIZE:
+            _thumbnail_probe_cache.popitem(last=False)
+            _thumbnail_probe_stats["evictions"] += 1
+    return available
+
+def get_thumbnail_probe_stats():
+    with _thumbnail_probe_lock:
+        return dict(_thumbnail_probe_stats, size=len(_thumbnail_probe_cache))
+
+def is_valid_species_code(species_code):
+    """True if species_code is safe to use in /thumb URLs and thumbnail cache file names."""
+    return isinstance(species_code, str) and SPECIES_CODE_PATTERN.fullmatch(species_code) is not None
+
+def parse_v2_detection_item(detection):
     try:
         name = detection.get('commonName', 'Unknown Species')
         time_raw = f"{detection.get('date', '')} {detection.get('time', '')}".strip()
         confidence_value = int(detection.get('confidence', 0.0) * 100)
         species_code = detection.get('speciesCode')
-        image_url = f"http://{server_ip}:8080/api/v2/species/{species_code}/thumbnail" if species_code else ""
+        if not is_valid_species_code(species_code):
+            # Never probed or written to disk; the bird falls back to the local image cache
+            species_code = None
+        # Served through the local /thumb proxy so the kiosk never hits BirdNET-Go directly
+        image_url = f"/thumb/{species_code}" if species_code else ""
         is_new_species = detection.get('isNewSpecies', False)
 
         return {
-            "name": name, "time_raw": time_raw, "confidence_value": confidence_value,
-            "image_url": image_url, "copyright": "", "is_new_species": is_new_species
+            "name": name, "time_raw": time_raw, "timestamp_ms": parse_detection_timestamp_ms(time_raw),
+            "confidence_value": confidence_value, "species_code": species_code, "image_url": image_url, "copyright": "",
+            "is_new_species": is_new_species
         }
     except (AttributeError, TypeError, KeyError) as e:
         print(f"Warning: Could not parse a v2 detection item, skipping. Error: {e}, Data: {detection}")
         return None
 
-# --- Core Data Fetching Logic ---
-def get_cached_image(species_name):
-    species_folder_name = "".join(c for c in species_name if c.isalnum() or c in ' _').rstrip().replace(' ', '_')
-    species_dir = os.path.join(CACHE_DIRECTORY, species_folder_name)
-    if os.path.isdir(species_dir):
-        images = sorted([f for f in os.listdir(species_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-        if not images: return None
-        chosen_image = random.choice(images)
-        attr_path = os.path.join(species_dir, f"{os.path.splitext(chosen_image)[0]}.txt")
+# --- Thumbnail Disk Cache ---
+def thumbnail_upstream_url(species_code):
+    """Thumbnail URL on the first station whose circuit is closed (or the first station)."""
+    with _breaker_lock:
+        healthy = [station for station in _stations.values() if station["breaker"] == "closed"]
+    station = healthy[0] if healthy else next(iter(_stations.values()))
+    return urljoin(station["url"], f"api/v2/species/{species_code}/thumbnail")
+
+def _ensure_thumbnail_index():
+    """Load the thumbnail index from disk once, least recently written first."""
+    global _thumbnail_index_loaded, _thumbnail_cache_bytes
+    if _thumbnail_index_loaded:
+        return
+    with _thumbnail_index_lock:
+        if _thumbnail_index_loaded:
+            return
+        os.makedirs(THUMBNAIL_CACHE_DIRECTORY, exist_ok=True)
+        entries = []
+        for file_entry in os.scandir(THUMBNAIL_CACHE_DIRECTORY):
+            if not file_entry.is_file() or file_entry.name.endswith('.tmp'):
+                continue
+            stat = file_entry.stat()
+            species_code = os.path.splitext(file_entry.name)[0]
+            entries.append((stat.st_mtime, species_code, {
+                "path": os.path.abspath(file_entry.path),
+                "mimetype": mimetypes.guess_type(file_entry.name)[0] or 'image/jpeg',
+                "size": stat.st_size, "fetched_at": stat.st_mtime, "etag": None
+            }))
+        for _, species_code, entry in sorted(entries, key=lambda e: e[0]):
+            _thumbnail_index[species_code] = entry
+            _thumbnail_cache_bytes += entry["size"]
+        _thumbnail_index_loaded = True
+
+def is_thumbnail_cached(species_code):
+    _ensure_thumbnail_index()
+    return species_code in _thumbnail_index
+
+def _fetch_thumbnail(species_code, etag=None):
+    """Download a thumbnail into the disk cache and return its index entry, or None."""
+    global _thumbnail_cache_bytes
+    headers = {'Accept': 'image/*'}
+    if etag:
+        headers['If-None-Match'] = etag
+    try:
+        response = upstream_request('GET', 'thumbnail', thumbnail_upstream_url(species_code), headers=headers)
+    except requests.exceptions.RequestException as e:
+        print(f"[INFO] Could not fetch thumbnail for {species_code}: {e}")
+        with _thumbnail_index_lock:
+            _thumbnail_cache_stats["errors"] += 1
+        return None
+
+    if response.status_code == 304:
+        with _thumbnail_index_lock:
+            entry = _thumbnail_index.get(species_code)
+            if entry is not None:
+                entry["fetched_at"] = time.time()
+        return entry
+
+    mimetype = response.headers.get('Content-Type', 'image/jpeg').split(';')[0].strip()
+    if response.status_code != 200 or not mimetype.startswith('image/'):
+        with _thumbnail_index_lock:
+            _thumbnail_cache_stats["errors"] += 1
+        return None
+
+    path = os.path.abspath(os.path.join(THUMBNAIL_CACHE_DIRECTORY, f"{species_code}{mimetypes.guess_extension(mimetype) or '.img'}"))
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error saving thumbnail for {species_code}: {e}")
+        return None
+
+    entry = {"path": path, "mimetype": mimetype, "size": len(response.content),
+             "fetched_at": time.time(), "etag": response.headers.get('ETag')}
+    evicted = []
+    with _thumbnail_index_lock:
+        previous = _thumbnail_index.pop(species_code, None)
+        if previous is not None:
+            _thumbnail_cache_bytes -= previous["size"]
+            if previous["path"] != path:
+                evicted.append(previous["path"])
+        _thumbnail_index[species_code] = entry
+        _thumbnail_cache_bytes += entry["size"]
+        _thumbnail_cache_stats["fetches"] += 1
+        while _thumbnail_cache_bytes > THUMBNAIL_CACHE_MAX_BYTES and len(_thumbnail_index) > 1:
+            _, oldest = _thumbnail_index.popitem(last=False)
+            _thumbnail_cache_bytes -= oldest["size"]
+            _thumbnail_cache_stats["evictions"] += 1
+            evicted.append(oldest["path"])
+    for old_path in evicted:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+    return entry
+
+def _fetch_thumbnail_in_background(species_code, etag=None):
+    try:
+        _fetch_thumbnail(species_code, etag)
+    finally:
+        with _thumbnail_index_lock:
+            _thumbnail_inflight.pop(species_code).set()
+
+def prefetch_thumbnail(species_code):
+    """Queue a background download for a thumbnail that is not on disk yet."""
+    _ensure_thumbnail_index()
+    with _thumbnail_index_lock:
+        if species_code in _thumbnail_index or species_code in _thumbnail_inflight:
+            return
+        _thumbnail_inflight[species_code] = threading.Event()
+    _thumbnail_fetch_pool.submit(_fetch_thumbnail_in_background, species_code)
+
+def get_thumbnail(species_code):
+    """Return the disk cache entry for a thumbnail, downloading it on first use.
+
+    Entries older than THUMBNAIL_REVALIDATE_AFTER are still served immediately
+    while a conditional re-fetch runs in the background.
+    """
+    _ensure_thumbnail_index()
+    with _thumbnail_index_lock:
+        entry = _thumbnail_index.get(species_code)
+        if entry is not None:
+            _thumbnail_index.move_to_end(species_code)
+            _thumbnail_cache_stats["hits"] += 1
+            if time.time() - entry["fetched_at"] > THUMBNAIL_REVALIDATE_AFTER and species_code not in _thumbnail_inflight:
+                _thumbnail_inflight[species_code] = threading.Event()
+                _thumbnail_cache_stats["revalidations"] += 1
+                _thumbnail_fetch_pool.submit(_fetch_thumbnail_in_background, species_code, entry["etag"])
+            return entry
+        # Only one request downloads a given thumbnail; the rest wait for it
+        done = _thumbnail_inflight.get(species_code)
+        if done is None:
+            _thumbnail_inflight[species_code] = threading.Event()
+    if done is None:
+        try:
+            return _fetch_thumbnail(species_code)
+        finally:
+            with _thumbnail_index_lock:
+                _thumbnail_inflight.pop(species_code).set()
+    done.wait(timeout=10)
+    with _thumbnail_index_lock:
+        return _thumbnail_index.get(species_code)
+
+def get_thumbnail_cache_stats():
+    with _thumbnail_index_lock:
+        return dict(_thumbnail_cache_stats, entries=len(_thumbnail_index), bytes=_thumbnail_cache_bytes)
+
+# --- Offline Image Manifest ---
+def _scan_species_folder(folder_name, species_dir):
+    """List a species folder's images with their attribution text preloaded."""
+    entries = []
+    for image in sorted(f for f in os.listdir(species_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))):
+        attr_path = os.path.join(species_dir, f"{os.path.splitext(image)[0]}.txt")
         copyright_info = ""
-        if os.path.exists(attr_path):
+        try:
             with open(attr_path, 'r', encoding='utf-8') as f: copyright_info = f.read().strip()
-        image_url = url_for('static', filename=os.path.join(os.path.basename(CACHE_DIRECTORY), species_folder_name, chosen_image).replace('\\', '/'))
-        return {"image_url": image_url, "copyright": copyright_info}
-    return None
+        except OSError:
+            pass
+        # Built by hand rather than with url_for: the poller runs outside any request context
+        image_url = f"{app.static_url_path}/" + os.path.join(os.path.basename(CACHE_DIRECTORY), folder_name, image).replace('\\', '/')
+        entries.append({"image_url": image_url, "copyright": copyright_info})
+    return entries
+
+def refresh_image_manifest(force=False):
+    """Rescan only the species folders whose directory mtime changed since the last check.
+
+    Adding or removing files changes the folder mtime, so new downloads are
+    picked up within IMAGE_MANIFEST_CHECK_INTERVAL without rescanning the cache.
+    """
+    global _image_manifest, _image_manifest_root_mtime, _image_manifest_checked_at, _image_manifest_version
+    if not force and time.monotonic() - _image_manifest_checked_at < IMAGE_MANIFEST_CHECK_INTERVAL:
+        return
+    if not _image_manifest_lock.acquire(blocking=force):
+        return  # Another thread is already refreshing
+    try:
+        _image_manifest_checked_at = time.monotonic()
+        try:
+            root_mtime = os.stat(CACHE_DIRECTORY).st_mtime_ns
+        except OSError:
+            if _image_manifest:
+                _image_manifest_version += 1
+            _image_manifest, _image_manifest_root_mtime = {}, None
+            return
+
+        # Species folders only appear or disappear when the root mtime changes
+        if root_mtime != _image_manifest_root_mtime:
+            folders = [entry.name for entry in os.scandir(CACHE_DIRECTORY) if entry.is_dir()]
+        else:
+            folders = list(_image_manifest)
+
+        manifest = {}
+        rescanned = 0
+        for folder_name in folders:
+            species_dir = os.path.join(CACHE_DIRECTORY, folder_name)
+            try:
+                mtime = os.stat(species_dir).st_mtime_ns
+                entry = _image_manifest.get(folder_name)
+                if entry is None or entry["mtime_ns"] != mtime:
+                    entry = {"mtime_ns": mtime, "images": _scan_species_folder(folder_name, species_dir)}
+                    rescanned += 1
+            except OSError:
+                continue
+            manifest[folder_name] = entry
+
+        # Swap in the new index wholesale so readers never see a partial update
+        if rescanned or manifest.keys() != _image_manifest.keys():
+            _image_manifest_version += 1
+        _image_manifest, _image_manifest_root_mtime = manifest, root_mtime
+        if rescanned:
+            print(f"[INFO] Image manifest: rescanned {rescanned} of {len(manifest)} species folders")
+    finally:
+        _image_manifest_lock.release()
 
-def get_offline_fallback_data():
-    print("[INFO] Loading data from local cache.")
-    species_list = load_species_from_file(SPECIES_FILE)
-    if not species_list: return []
+# --- Offline Rotation Deck ---
+def _species_file_mtime():
+    try:
+        return os.stat(SPECIES_FILE).st_mtime_ns
+    except OSError:
+        return None
 
-    # Filter species to only those with cached images
-    species_with_images = []
-    for common_name, scientific_name in species_list:
-        cached_asset = get_cached_image(common_name)
-        if cached_asset:
-            species_with_images.append((common_name, scientific_name, cached_asset))
+def refresh_offline_deck(force=False):
+    """Rebuild the offline species list if the image manifest or species file changed.
+
+    Checks run at most every IMAGE_MANIFEST_CHECK_INTERVAL, so dealing a hand
+    normally costs no CSV parsing or filesystem access.
+    """
+    global _offline_species, _offline_bag, _offline_bag_position, _offline_deck_source, _offline_deck_checked_at
+    if not force and time.monotonic() - _offline_deck_checked_at < IMAGE_MANIFEST_CHECK_INTERVAL:
+        return
+    refresh_image_manifest(force=force)
+    with _offline_deck_lock:
+        _offline_deck_checked_at = time.monotonic()
+        source = (_image_manifest_version, _species_file_mtime())
+        if source == _offline_deck_source:
+            return
+        manifest = _image_manifest
+        species = []
+        for common_name, scientific_name in load_species_from_file(SPECIES_FILE):
+            entry = manifest.get(get_species_folder_name(common_name))
+            if entry and entry["images"]:
+                species.append((common_name, scientific_name, entry["images"]))
+        _offline_species = species
+        _offline_bag, _offline_bag_position = [], 0  # Reshuffled on the next deal
+        _offline_deck_source = source
+    print(f"[INFO] Offline deck: {len(species)} species with cached images")
+
+def _reshuffle_offline_bag(held_names):
+    """Caller holds _offline_deck_lock. Species already in the hand being dealt go to the back."""
+    global _offline_bag, _offline_bag_position
+    bag = [(common_name, scientific_name, random.choice(images)) for common_name, scientific_name, images in _offline_species]
+    random.shuffle(bag)
+    bag.sort(key=lambda card: card[0] in held_names)  # Stable, so the shuffle is kept otherwise
+    _offline_bag, _offline_bag_position = bag, 0
+
+def deal_offline_species(count):
+    """Return the next `count` (common name, scientific name, image) cards from the offline deck.
+
+    Every species with a cached image is dealt once before any repeats, and
+    the bag is only reshuffled when it runs out.
+    """
+    global _offline_bag_position
+    refresh_offline_deck()
+    hand = []
+    with _offline_deck_lock:
+        count = min(count, len(_offline_species))
+        while len(hand) < count:
+            if _offline_bag_position >= len(_offline_bag):
+                _reshuffle_offline_bag({card[0] for card in hand})
+            hand.append(_offline_bag[_offline_bag_position])
+            _offline_bag_position += 1
+    return hand
+
+# --- Station Circuit Breakers ---
+def _set_breaker_state(station, state):
+    """Caller holds _breaker_lock."""
+    if state != station["breaker"]:
+        print(f"[INFO] Station {station['name']} circuit {station['breaker']} -> {state}")
+        station["breaker"] = state
+        station["stats"]["transitions"][state] += 1
+
+def record_station_success(station, latency):
+    with _breaker_lock:
+        station["failures"] = 0
+        station["retry_delay"] = BREAKER_RETRY_BASE
+        station["last_success"] = time.time()
+        station["last_latency"] = round(latency, 3)
+        _set_breaker_state(station, "closed")
+
+def record_station_failure(station):
+    """Count a failed detections call, opening the circuit at the threshold or after a failed probe."""
+    with _breaker_lock:
+        station["stats"]["errors"] += 1
+        if station["breaker"] == "half_open":
+            station["retry_delay"] = min(station["retry_delay"] * 2, BREAKER_RETRY_MAX)
+        else:
+            station["failures"] += 1
+            if station["breaker"] == "closed" and station["failures"] < BREAKER_FAILURE_THRESHOLD:
+                return
+        station["retry_at"] = time.monotonic() + station["retry_delay"]
+        _set_breaker_state(station, "open")
+
+def _probe_station(station):
+    """Ask a station for a single detection with a short timeout."""
+    try:
+        response = upstream_request('GET', 'detections_probe', urljoin(station["url"], API_ENDPOINT), params={'limit': 1})
+        response.raise_for_status()
+        return True
+    except requests.exceptions.RequestException:
+        return False
+
+def allow_station_request(station):
+    """Return True if the station's detections endpoint may be called now.
+
+    While the circuit is open this returns False without touching the station.
+    Once the retry delay has passed, a single caller moves the circuit to
+    half-open and sends one cheap probe. Success closes the circuit. Failure
+    reopens it with a doubled delay.
+    """
+    with _breaker_lock:
+        if station["breaker"] == "closed":
+            return True
+        if station["breaker"] == "half_open" or time.monotonic() < station["retry_at"]:
+            station["stats"]["short_circuited"] += 1
+            return False
+        _set_breaker_state(station, "half_open")
+        station["stats"]["probes"] += 1
+
+    started = time.monotonic()
+    if _probe_station(station):
+        record_station_success(station, time.monotonic() - started)
+        return True
+    with _breaker_lock:
+        station["stats"]["probe_failures"] += 1
+    record_station_failure(station)
+    return False
 
-    if not species_with_images:
+def get_breaker_retry_in():
+    """Seconds until the next recovery probe of any open station, or None if no circuit is open."""
+    now = time.monotonic()
+    with _breaker_lock:
+        waits = [max(0, station["retry_at"] - now) for station in _stations.values() if station["breaker"] == "open"]
+    return min(waits) if waits else None
+
+def get_station_stats():
+    """Report per-station health, latency and fetch counters."""
+    now = time.monotonic()
+    report = {}
+    with _breaker_lock:
+        for name, station in _stations.items():
+            report[name] = dict(
+                station["stats"], transitions=dict(station["stats"]["transitions"]),
+                url=station["url"], state=station["breaker"], consecutive_failures=station["failures"],
+                retry_delay=station["retry_delay"],
+                retry_in=max(0, station["retry_at"] - now) if station["breaker"] == "open" else None,
+                last_success=station["last_success"], last_latency=station["last_latency"],
+                buffered=len(station["ids"])
+            )
+    return report
+
+# --- Detection Ring Buffer ---
+def _detection_identity(station, detection):
+    """Stable identity of a raw v2 detection: station name plus its id, or species and timestamp."""
+    detection_id = detection.get('id')
+    if detection_id is None:
+        detection_id = f"{detection.get('commonName')}_{detection.get('date', '')} {detection.get('time', '')}"
+    return f"{station['name']}:{detection_id}"
+
+def _detection_sort_key(bird):
+    return bird['timestamp_ms'] or 0
+
+def _drop_station_detections(station):
+    """Remove a station's detections before a full sync. Caller holds _detection_buffer_lock."""
+    if station["ids"]:
+        kept = [bird for bird in _detection_buffer if bird['station'] != station["name"]]
+        _detection_buffer.clear()
+        _detection_buffer.extend(kept)
+        station["ids"].clear()
+
+def _merge_into_buffer(new_birds):
+    """Merge parsed detections into the time-ordered buffer. Caller holds _detection_buffer_lock."""
+    new_birds.sort(key=_detection_sort_key, reverse=True)
+    if not _detection_buffer or _detection_sort_key(new_birds[-1]) >= _detection_sort_key(_detection_buffer[0]):
+        # Usual case: everything new is newer than the buffer head
+        _detection_buffer.extendleft(reversed(new_birds))
+    else:
+        merged = list(heapq.merge(_detection_buffer, new_birds, key=_detection_sort_key, reverse=True))
+        _detection_buffer.clear()
+        _detection_buffer.extend(merged)
+
+    # Cap each station separately, so a busy station never pushes out a quieter one's detections
+    excess = {}
+    for name, count in Counter(bird['station'] for bird in _detection_buffer).items():
+        if count > DETECTION_BUFFER_SIZE:
+            excess[name] = count - DETECTION_BUFFER_SIZE
+    if excess:
+        kept = []
+        for bird in reversed(_detection_buffer):  # Oldest first
+            if excess.get(bird['station'], 0) > 0:
+                excess[bird['station']] -= 1
+                _stations[bird['station']]["ids"].discard(bird['detection_id'])
+            else:
+                kept.append(bird)
+        _detection_buffer.clear()
+        _detection_buffer.extendleft(kept)
+
+def _request_station_detections(station, limit):
+    response = upstream_request('GET', 'detections', urljoin(station["url"], API_ENDPOINT),
+                                params={'limit': limit}, timeout=station["timeout"])
+    response.raise_for_status()
+    detections = response.json()
+    return detections if isinstance(detections, list) else []
+
+def _fetch_station(station, force_full):
+    """Fetch the raw detections a station has that the buffer lacks.
+
+    Returns (new raw detections newest first, replace), or None if the
+    station's circuit is open. replace is True when the result supersedes
+    everything buffered for the station: a full sync, or an empty answer. Only this station's entry in _stations is
+    touched, so stations can be fetched in parallel. Runs under _detection_fetch_lock, not the buffer lock.
+    """
+    if not allow_station_request(station):
+        return None
+    stats = station["stats"]
+    full_sync = force_full or not station["ids"] or time.monotonic() - station["last_full_sync"] > DETECTION_RESYNC_INTERVAL
+    started = time.monotonic()
+    try:
+        detections = _request_station_detections(station, DETECTION_BUFFER_SIZE if full_sync else INCREMENTAL_FETCH_LIMIT)
+        new_items = detections
+        if not full_sync:
+            stats["incremental_fetches"] += 1
+            new_items = list(takewhile(lambda d: _detection_identity(station, d) not in station["ids"], detections))
+            if detections and len(new_items) == len(detections):
+                # Nothing in the small batch overlapped the buffer, so fetch the whole window
+                stats["gap_resyncs"] += 1
+                detections = new_items = _request_station_detections(station, DETECTION_BUFFER_SIZE)
+                full_sync = True
+    except requests.exceptions.RequestException:
+        record_station_failure(station)
+        raise
+    record_station_success(station, time.monotonic() - started)
+    if full_sync:
+        stats["full_syncs"] += 1
+        station["last_full_sync"] = time.monotonic()
+    return new_items[:DETECTION_BUFFER_SIZE], full_sync or not detections
+
+def fetch_new_detections(force_full=False):
+    """Bring the detection buffer up to date from every station and return newly seen parsed detections.
+
+    Stations are fetched concurrently, so a refresh takes as long as the
+    slowest station that answers. Stations with an open circuit are skipped
+    at once. After a station's first full load only INCREMENTAL_FETCH_LIMIT
+    detections are requested from it. If none of them overlap the buffer, its
+    whole window is re-fetched. A full sync also runs every
+    DETECTION_RESYNC_INTERVAL.
+
+    Returns None when no station has any detections. Raises RequestException
+    when no station could be reached.
+    """
+    with _detection_fetch_lock:
+        # Upstream calls run without the buffer lock, so readers such as
+        # /api/stats never wait on a slow station
+        stations = list(_stations.values())
+        futures = [_station_pool.submit(_fetch_station, station, force_full) for station in stations]
+        results = []
+        for station, future in zip(stations, futures):
+            try:
+                result = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"[INFO] Station {station['name']} unavailable: {e}")
+                continue
+            if result is not None:
+                results.append((station, result))
+        if not results:
+            raise requests.exceptions.ConnectionError("No BirdNET-Go station reachable")
+
+        new_birds = []
+        with _detection_buffer_lock:
+            for station, (detections, replace) in results:
+                if replace:
+                    _drop_station_detections(station)
+                for item in detections:
+                    bird = parse_v2_detection_item(item)
+                    if not bird:
+                        continue
+                    bird['detection_id'] = _detection_identity(station, item)
+                    bird['station'] = station["name"]
+                    bird['stations'] = [station["name"]]
+                    station["ids"].add(bird['detection_id'])
+                    new_birds.append(bird)
+                station["stats"]["new_detections"] += len(detections)
+            if new_birds:
+                _merge_into_buffer(new_birds)
+            if not _detection_buffer:
+                return None
+        return new_birds
+
+def _fold_cross_station_duplicates(detections):
+    """Fold reports of one bird heard by several stations into the newest report.
+
+    Walks newest first. A detection of the same species is treated as the
+    same bird if it comes from a station not yet on the kept report and falls
+    within STATION_DEDUP_WINDOW of it. The kept report gains that station's
+    label and the higher confidence.
+    """
+    result = []
+    kept = {}  # species name -> index in result of the report later detections fold into
+    for bird in detections:
+        index = kept.get(bird['name'])
+        if index is not None:
+            report = result[index]
+            if (bird['station'] not in report['stations']
+                    and _detection_sort_key(report) - _detection_sort_key(bird) <= STATION_DEDUP_WINDOW * 1000):
+                result[index] = dict(report, stations=report['stations'] + [bird['station']],
+                                     confidence_value=max(report['confidence_value'], bird['confidence_value']))
+                continue
+        kept[bird['name']] = len(result)
+        result.append(bird)
+    return result
+
+def get_buffered_detections():
+    """Return the buffered detections, newest first, with cross-station duplicates folded.
+
+    Items may be shared with the buffer, so treat them as read-only.
+    """
+    with _detection_buffer_lock:
+        detections = list(_detection_buffer)
+    if len(_stations) > 1:
+        detections = _fold_cross_station_duplicates(detections)
+    return detections
+
+def get_detection_buffer_stats():
+    with _detection_buffer_lock:
+        totals = {"full_syncs": 0, "incremental_fetches": 0, "gap_resyncs": 0, "new_detections": 0}
+        for station in _stations.values():
+            for key in totals:
+                totals[key] += station["stats"][key]
+        return dict(totals, buffered=len(_detection_buffer), species=len({bird['name'] for bird in _detection_buffer}))
+
+# --- Detection Ranking ---
+# Each policy maps a species summary to a score; higher ranks first
+RANKING_POLICIES = {
+    'pinned': lambda summary: summary["pinned"],
+    'recent': lambda summary: summary["recency"],
+    'confidence': lambda summary: summary["best_confidence"],
+    'frequency': lambda summary: summary["count"],
+}
+
+def rank_detections(detections, pinned, order=RANKING_ORDER, limit=RANKING_CANDIDATE_LIMIT):
+    """Rank species from detections (newest first) and return copies of the top `limit`.
+
+    A single pass builds one summary per species (newest detection, count and
+    best confidence in the window). heapq then selects the top `limit` by the
+    policies in `order`. Each returned bird is the species' newest detection,
+    tagged with is_pinned and detection_count.
+    """
+    summaries = {}
+    for position, bird in enumerate(detections):
+        summary = summaries.get(bird['name'])
+        if summary is None:
+            summaries[bird['name']] = summary = {
+                "bird": bird, "pinned": bird['name'] in pinned, "recency": -position,
+                "count": 0, "best_confidence": 0
+            }
+        summary["count"] += 1
+        summary["best_confidence"] = max(summary["best_confidence"], bird['confidence_value'])
+
+    policies = [RANKING_POLICIES[name] for name in order]
+    ranked = heapq.nlargest(limit, summaries.values(),
+                            key=lambda summary: tuple(policy(summary) for policy in policies) + (summary["recency"],))
+
+    return [dict(summary["bird"], is_pinned=summary["pinned"], detection_count=summary["count"]) for summary in ranked]
+
+# --- Core Data Fetching Logic ---
+def get_cached_image(species_name):
+    refresh_image_manifest()
+    entry = _image_manifest.get(get_species_folder_name(species_name))
+    if not entry or not entry["images"]:
+        return None
+    return random.choice(entry["images"])
+
+def get_offline_fallback_data():
+    print("[INFO] Loading data from local cache.")
+    dealt = deal_offline_species(MAX_DISPLAYED_BIRDS)
+    if not dealt:
         print("[WARNING] No cached images found for any species")
         return []
 
-    # Sample from species that actually have images
-    num_to_sample = min(len(species_with_images), 4)
-    sampled_species = random.sample(species_with_images, num_to_sample)
-
     fallback_data = []
-    for common_name, scientific_name, cached_asset in sampled_species:
+    for common_name, scientific_name, cached_asset in dealt:
         fallback_data.append({
-            "name": common_name, "time_display": "Offline", "confidence": "0%",
-            "confidence_value": 0, "image_url": cached_asset['image_url'],
-            "copyright": cached_asset['copyright'], "time_raw": "", "is_offline": True
+            "name": common_name, "confidence_value": 0, "image_url": cached_asset['image_url'],
+            "copyright": cached_asset['copyright'], "time_raw": "", "timestamp_ms": None, "is_offline": True
         })
 
     return fallback_data
 
+def _use_cached_image(bird):
+    """Point a bird at a locally cached image; returns False if none exists."""
+    cached_asset = get_cached_image(bird['name'])
+    if not cached_asset:
+        return False
+    bird['image_url'] = cached_asset['image_url']
+    bird['copyright'] = cached_asset['copyright']
+    return True
+
+def select_birds_with_images(candidates, limit):
+    """Return the first `limit` candidates that have a usable image, in ranking order.
+
+    Thumbnail probes run concurrently over a sliding window just ahead of the
+    bird being decided, so a slow probe only delays the birds ranked after it.
+    Once IMAGE_VALIDATION_DEADLINE passes, outstanding probes count as failed
+    and the remaining birds fall back to the local cache.
+    """
+    deadline = time.monotonic() + IMAGE_VALIDATION_DEADLINE
+    probes = {}
+    selected = []
+
+    for index, bird in enumerate(candidates):
+        # Keep the probe window filled ahead of the current position
+        for ahead in range(index, min(index + IMAGE_VALIDATION_WORKERS, len(candidates))):
+            candidate = candidates[ahead]
+            if ahead not in probes and candidate.get('image_url'):
+                probes[ahead] = _image_validation_pool.submit(
+                    check_thumbnail_cached, candidate['species_code'], thumbnail_upstream_url(candidate['species_code']))
+
+        has_api_image = False
+        if index in probes:
+            try:
+                has_api_image = probes[index].result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                has_api_image = False
+
+        if has_api_image:
+            # Warm the disk cache so the card swap does not wait on BirdNET-Go
+            prefetch_thumbnail(bird['species_code'])
+        if has_api_image or _use_cached_image(bird):
+            selected.append(bird)
+            if len(selected) >= limit:
+                break
+
+    # Drop probes that never started; running ones still fill the probe cache
+    for future in probes.values():
+        future.cancel()
+    return selected
+
 def get_bird_data():
-    server_ip = get_local_ip()
-    api_url = urljoin(BASE_URL, API_ENDPOINT)
-    params = {'limit': 200}  # Increased from 50 to get more detection history
     try:
-        response = requests.get(api_url, headers=HEADERS, proxies=PROXIES, timeout=10, params=params)
-        response.raise_for_status()
-        detections = response.json()
-        if not isinstance(detections, list) or not detections:
+        # Stations with an open circuit are skipped without waiting on them
+        new_detections = fetch_new_detections()
+        if new_detections is None:
             return get_offline_fallback_data(), True
-        all_parsed = [d for d in [parse_v2_detection_item(item, server_ip) for item in detections] if d]
-        if not all_parsed:
+        record_detection_activity(new_detections)
+        detections = get_buffered_detections()
+        if not detections:
             return get_offline_fallback_data(), True
 
         # Process new species and add to pinned list
-        for bird in all_parsed:
+        for bird in new_detections:
             if bird.get('is_new_species', False):
                 add_pinned_species(bird['name'])
 
         # Get currently active pinned species
         active_pinned = get_active_pinned_species()
 
-        # Separate pinned and unpinned birds
-        pinned_birds = []
-        unpinned_birds = []
-
-        for bird in all_parsed:
-            if bird['name'] in active_pinned:
-                bird['is_pinned'] = True
-                if bird['name'] not in [b['name'] for b in pinned_birds]:
-                    pinned_birds.append(bird)
-            else:
-                bird['is_pinned'] = False
-                unpinned_birds.append(bird)
-
-        # Get unique unpinned species (deduplicate by name)
-        unique_unpinned = []
-        seen_names = set()
-        for bird in unpinned_birds:
-            if bird['name'] not in seen_names:
-                unique_unpinned.append(bird)
-                seen_names.add(bird['name'])
-
-        print(f"[DEBUG] Found {len(pinned_birds)} pinned birds and {len(unique_unpinned)} unique unpinned species from {len(all_parsed)} total detections")
-
-        # Combine: pinned first, then unpinned
-        combined_list = pinned_birds + unique_unpinned
+        # Copies of the top-ranked species, so the buffer is never mutated below
+        ranked = rank_detections(detections, active_pinned)
+        print(f"[DEBUG] Ranked top {len(ranked)} species from {len(detections)} buffered detections by {'/'.join(RANKING_ORDER)}")
 
         # Check image URLs and filter out birds without valid images
-        final_list = []
-        for bird in combined_list:
-            has_valid_image = False
-
-            if bird.get('image_url'):
-                if check_image_url_fast(bird['image_url']):
-                    has_valid_image = True
-                else:
-                    # API image not available, try cache
-                    cached_asset = get_cached_image(bird['name'])
-                    if cached_asset:
-                        bird['image_url'] = cached_asset['image_url']
-                        bird['copyright'] = cached_asset['copyright']
-                        has_valid_image = True
-            else:
-                # No image URL from API, use cache
-                cached_asset = get_cached_image(bird['name'])
-                if cached_asset:
-                    bird['image_url'] = cached_asset['image_url']
-                    bird['copyright'] = cached_asset['copyright']
-                    has_valid_image = True
-
-            # Only include birds with valid images
-            if has_valid_image:
-                final_list.append(bird)
-                if len(final_list) >= 4:
-                    break
+        final_list = select_birds_with_images(ranked, MAX_DISPLAYED_BIRDS)
 
         print(f"[DEBUG] Final list has {len(final_list)} birds with valid images")
-
-        new_id = "-".join([f"{d['name']}_{d['time_raw']}" for d in final_list])
-
-        if new_id == DETECTION_CACHE["id"]:
-            data_to_process = DETECTION_CACHE["raw_data"]
-        else:
-            DETECTION_CACHE["raw_data"] = final_list
-            DETECTION_CACHE["id"] = new_id
-            data_to_process = final_list
-
-        display_data = []
-        for bird in data_to_process:
-            bird_display_copy = bird.copy()
-            bird_display_copy['time_display'] = format_seconds_ago(parse_absolute_time_to_seconds_ago(bird['time_raw']))
-            bird_display_copy['confidence'] = f"{bird['confidence_value']}%"
-            display_data.append(bird_display_copy)
-
-        return display_data, False
+        return final_list, False
     except requests.exceptions.RequestException:
         print("[INFO] BirdNET-Go API unavailable, using offline mode")
         return get_offline_fallback_data(), True
 
+# --- Detection Payloads ---
+def compact_bird(bird):
+    """Compact /data entry: epoch-ms timestamp and numeric confidence, formatted by the client."""
+    entry = {
+        "id": bird.get('detection_id', f"offline:{bird['name']}"), "name": bird['name'],
+        "ts": bird['timestamp_ms'], "confidence": bird['confidence_value'],
+        "image_url": bird['image_url'], "copyright": bird['copyright'],
+        "pinned": bird.get('is_pinned', False), "offline": bird.get('is_offline', False)
+    }
+    if len(_stations) > 1:
+        entry["stations"] = bird.get('stations', [])
+    return entry
+
+def display_bird(bird, now_ms):
+    """Full /data entry with server-formatted time_display and confidence strings."""
+    if bird.get('is_offline'):
+        time_display = "Offline"
+    else:
+        time_display = format_seconds_ago(max(0, now_ms - (bird['timestamp_ms'] or now_ms)) / 1000)
+    return dict(bird, time_display=time_display, confidence=f"{bird['confidence_value']}%")
+
+# --- Adaptive Poll Scheduler ---
+def record_detection_activity(new_birds):
+    """Add newly fetched detections that are newer than any seen before to the activity window.
+
+    Detections a full sync fetches again are older than the newest one already
+    seen, so resyncs do not count as activity. Returns the number of fresh detections.
+    """
+    global _newest_detection_ms, _fresh_since_decision
+    fresh = sorted(bird['timestamp_ms'] for bird in new_birds
+                   if bird.get('timestamp_ms') and (_newest_detection_ms is None or bird['timestamp_ms'] > _newest_detection_ms))
+    with _poll_schedule_lock:
+        _activity_timestamps.extend(fresh)
+        _fresh_since_decision += len(fresh)
+        if fresh:
+            _newest_detection_ms = fresh[-1]
+    return len(fresh)
+
+def _in_quiet_hours(hour):
+    if QUIET_HOURS is None:
+        return False
+    start, end = QUIET_HOURS
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+def next_poll_interval(api_is_down):
+    """Decide how long the detection poller sleeps, and record why.
+
+    A fresh detection since the last decision or a busy detection rate snaps back to
+    DETECTION_POLL_INTERVAL. Otherwise each quiet poll stretches the interval
+    by POLL_BACKOFF_FACTOR, up to IDLE_POLL_INTERVAL or to
+    QUIET_HOURS_POLL_INTERVAL during quiet hours.
+    """
+    global _fresh_since_decision
+    cutoff_ms = (time.time() - ACTIVITY_WINDOW) * 1000
+    with _poll_schedule_lock:
+        fresh_count, _fresh_since_decision = _fresh_since_decision, 0
+        while _activity_timestamps and _activity_timestamps[0] < cutoff_ms:
+            _activity_timestamps.popleft()
+        rate = len(_activity_timestamps) / (ACTIVITY_WINDOW / 60)
+        previous = _poll_schedule["interval"]
+
+        if api_is_down:
+            interval, reason = OFFLINE_POLL_INTERVAL, "offline"
+        elif fresh_count:
+            interval, reason = DETECTION_POLL_INTERVAL, "detection"
+        elif rate >= BUSY_DETECTION_RATE:
+            interval, reason = DETECTION_POLL_INTERVAL, "busy"
+        else:
+            quiet_hours = _in_quiet_hours(datetime.now().hour)
+            ceiling = QUIET_HOURS_POLL_INTERVAL if quiet_hours else IDLE_POLL_INTERVAL
+            interval = min(max(previous, DETECTION_POLL_INTERVAL) * POLL_BACKOFF_FACTOR, ceiling)
+            reason = "quiet_hours" if quiet_hours else "idle"
+
+        _poll_schedule_stats["polls"] += 1
+        _poll_schedule_stats["reasons"][reason] = _poll_schedule_stats["reasons"].get(reason, 0) + 1
+        if interval != previous or reason != _poll_schedule["reason"]:
+            _poll_schedule_log.append({"time": time.time(), "interval": interval, "reason": reason, "rate": round(rate, 2)})
+            if reason != _poll_schedule["reason"]:
+                print(f"[INFO] Poll interval {previous:g}s -> {interval:g}s ({reason}, {rate:.2f} detections/min)")
+        _poll_schedule.update(interval=interval, reason=reason, rate=round(rate, 2))
+    return interval
+
+def background_interval(base):
+    """Stretch a WiFi/microphone sample interval in step with the detection poll interval."""
+    scale = min(max(_poll_schedule["interval"] / DETECTION_POLL_INTERVAL, 1), BACKGROUND_MAX_SCALE)
+    return base * scale
+
+def get_poll_schedule_stats():
+    """Report the current poll decision, recent changes and polls saved against a fixed cadence."""
+    with _poll_schedule_lock:
+        elapsed = time.monotonic() - _poll_schedule_stats["started_at"]
+        fixed_polls = int(elapsed / DETECTION_POLL_INTERVAL)
+        return dict(
+            _poll_schedule,
+            polls=_poll_schedule_stats["polls"], reasons=dict(_poll_schedule_stats["reasons"]),
+            fixed_cadence_polls=fixed_polls, polls_saved=max(0, fixed_polls - _poll_schedule_stats["polls"]),
+            network_probe_interval=background_interval(NETWORK_PROBE_INTERVAL),
+            mic_sample_interval=background_interval(MIC_SAMPLE_INTERVAL),
+            recent_decisions=list(_poll_schedule_log)
+        )
+
+# --- Background Detection Poller ---
+def refresh_detection_snapshot():
+    """Fetch fresh detections and atomically publish them as the current snapshot."""
+    global _detection_snapshot
+    bird_data, api_is_down = get_bird_data()
+    payload = {'birds': [compact_bird(b) for b in bird_data], 'api_is_down': api_is_down}
+    compact_json = json.dumps(payload, separators=(',', ':'))
+    # The compact body is the change key for ETags and /stream. It carries absolute
+    # timestamps, so elapsed times (formatted by the client) never count as a change.
+    snapshot = {
+        "etag": hashlib.sha1(compact_json.encode('utf-8')).hexdigest(),
+        "birds": bird_data,
+        "api_is_down": api_is_down,
+        "compact": payload,
+        "compact_json": compact_json,
+        "updated_at": time.time()
+    }
+    with _snapshot_lock:
+        _detection_snapshot = snapshot
+    _snapshot_ready.set()
+    # The ETag rides along so a client that falls back to polling revalidates what it already shows
+    publish_stream_event('detections', dict(payload, etag=f'"{snapshot["etag"]}-c"'))
+    publish_stream_event('pinned', sorted(get_active_pinned_species()))
+    return snapshot
+
+def _detection_poller_loop():
+    while True:
+        try:
+            snapshot = refresh_detection_snapshot()
+            interval = next_poll_interval(snapshot["api_is_down"])
+            retry_in = get_breaker_retry_in()
+            if retry_in is not None:
+                # Wake for the recovery probe rather than a full offline interval later
+                interval = min(interval, retry_in + 0.1)
+        except Exception as e:
+            print(f"[ERROR] Detection poller failed: {e}")
+            interval = OFFLINE_POLL_INTERVAL
+        # Sleep until the next poll, or wake early when a refresh is requested
+        _refresh_requested.wait(interval)
+        _refresh_requested.clear()
+
+def request_snapshot_refresh():
+    """Ask the poller to refresh now, e.g. after the pinned set changed."""
+    _refresh_requested.set()
+
+def start_detection_poller():
+    """Start the background detection poller thread (idempotent)."""
+    global _poller_thread
+    with _snapshot_lock:
+        if _poller_thread is not None:
+            return
+        _poller_thread = threading.Thread(target=_detection_poller_loop, name="detection-poller", daemon=True)
+        _poller_thread.start()
+
+def get_detection_snapshot():
+    """Return the latest detection snapshot without touching BirdNET-Go."""
+    snapshot = _detection_snapshot
+    if snapshot is None:
+        # First request arrived before the poller published anything
+        start_detection_poller()
+        _snapshot_ready.wait(timeout=15)
+        snapshot = _detection_snapshot
+        if snapshot is None:
+            snapshot = refresh_detection_snapshot()
+    return snapshot
+
+# --- Server-Sent Events ---
+def publish_stream_event(topic, payload, key=None):
+    """Store the latest payload for a topic and wake /stream clients if it changed.
+
+    Events are compared by key (the JSON payload by default). An unchanged key
+    refreshes the stored payload without issuing a new event id.
+    """
+    global _stream_event_id
+    data = json.dumps(payload)
+    if key is None:
+        key = data
+    with _stream_condition:
+        current = _stream_events.get(topic)
+        if current is not None and current["key"] == key:
+            current["data"] = data
+            return False
+        _stream_event_id += 1
+        _stream_events[topic] = {"id": _stream_event_id, "key": key, "data": data}
+        _stream_condition.notify_all()
+    return True
+
+def _pending_stream_events(last_id):
+    """Return (id, topic, data) for every topic newer than last_id. Caller holds the condition."""
+    return sorted((event["id"], topic, event["data"]) for topic, event in _stream_events.items() if event["id"] > last_id)
+
+@app.route('/stream')
+def stream():
+    """Push detection, pinned, microphone and WiFi changes as Server-Sent Events."""
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_id = 0
+    start_detection_poller()
+    start_mic_sampler()
+    start_network_monitor()
+
+    def generate(last_id):
+        with _stream_condition:
+            if last_id > _stream_event_id:
+                # Server restarted since the client's last event, so replay everything
+                last_id = 0
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            with _stream_condition:
+                pending = _pending_stream_events(last_id)
+                if not pending:
+                    _stream_condition.wait(timeout=STREAM_HEARTBEAT_SECONDS)
+                    pending = _pending_stream_events(last_id)
+            if not pending:
+                yield ": heartbeat\n\n"
+                continue
+            for event_id, topic, data in pending:
+                yield f"id: {event_id}\nevent: {topic}\ndata: {data}\n\n"
+                last_id = event_id
+
+    return Response(generate(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # --- Flask Routes ---
 @app.route('/')
 def index():
-    bird_data, api_is_down = get_bird_data()
+    snapshot = get_detection_snapshot()
+    bird_data, api_is_down = snapshot["birds"], snapshot["api_is_down"]
     if not os.path.exists('static'): os.makedirs('static')
     template_path = 'index.html'
     if not os.path.exists(os.path.join('static', template_path)):
          with open(os.path.join('static', template_path), 'w') as f:
               f.write('<h1>Template file not found. Please create an index.html file.</h1>')
-    refresh_interval = 30 if api_is_down else 5
+    refresh_interval = _poll_schedule["interval"]
     server_url = f"http://{get_local_ip()}:8080"
     return render_template(
         template_path, birds=bird_data, refresh_interval=refresh_interval, 
-        api_is_down=api_is_down, server_url=server_url
+        api_is_down=api_is_down, server_url=server_url, data_etag=f'"{snapshot["etag"]}-c"',
+        initial_data=snapshot["compact"]
     )
 
 @app.route('/data')
 def data():
-    bird_data, api_is_down = get_bird_data()
-    return jsonify({'birds': bird_data, 'api_is_down': api_is_down})
+    """Return the detection snapshot, answering If-None-Match with 304 when unchanged.
+
+    ?format=compact returns the precomputed compact payload (epoch-ms "ts",
+    numeric "confidence", stable "id"). Without it, each bird also carries
+    server-formatted time_display and confidence strings.
+    """
+    snapshot = get_detection_snapshot()
+    compact = request.args.get('format') == 'compact'
+    # Each format gets its own ETag so a cached copy of one never validates the other.
+    # The full format's time_display strings age between snapshots, so its ETag is
+    # weak: the body is only semantically the same.
+    etag = f"{snapshot['etag']}-c" if compact else snapshot["etag"]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif compact:
+        response = Response(snapshot["compact_json"], mimetype='application/json')
+    else:
+        now_ms = time.time() * 1000
+        payload = {'birds': [display_bird(b, now_ms) for b in snapshot["birds"]], 'api_is_down': snapshot["api_is_down"]}
+        response = Response(json.dumps(payload), mimetype='application/json')
+    response.set_etag(etag, weak=not compact)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Refresh hints (seconds) for clients polling instead of using /stream
+    response.headers['X-Poll-Interval'] = f"{_poll_schedule['interval']:g}"
+    response.headers['X-Status-Interval'] = f"{background_interval(MIC_SAMPLE_INTERVAL):g}"
+    return response
+
+@app.route('/thumb/<species_code>')
+def thumbnail(species_code):
+    """Serve a BirdNET-Go species thumbnail from the local disk cache."""
+    if not is_valid_species_code(species_code):
+        return jsonify({'status': 'error', 'message': 'Invalid species code'}), 404
+    entry = get_thumbnail(species_code)
+    if entry is None:
+        return jsonify({'status': 'error', 'message': 'Thumbnail unavailable'}), 404
+    try:
+        return send_file(entry["path"], mimetype=entry["mimetype"], max_age=THUMBNAIL_BROWSER_MAX_AGE, conditional=True)
+    except OSError:
+        # Evicted between lookup and send
+        return jsonify({'status': 'error', 'message': 'Thumbnail unavailable'}), 404
 
 @app.route('/audio_status')
 def audio_status():
-    try:
-        status_url = "http://10.42.0.50/api/status"
-        response = requests.get(status_url, timeout=5)
-        response.raise_for_status()
-        status_data = response.json()
-        is_connected = status_data.get("streaming") is True
-        rssi = status_data.get("wifi_rssi", 0)  # Get WiFi RSSI value, default to 0 if not present
-    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError):
-        print("[INFO] Microphone status unavailable")
-        is_connected = False
-        rssi = 0
-    return jsonify({"connected": is_connected, "rssi": rssi})
+    """Return the latest microphone sample collected by the mic sampler."""
+    return jsonify(fetch_audio_status(get_latest_mic_sample()))
+
+@app.route('/api/audio/history')
+def audio_history():
+    """Return buffered microphone samples, oldest first, optionally only those after ?since=<epoch seconds>."""
+    since = request.args.get('since', type=float)
+    samples = get_mic_history()
+    if since is not None:
+        samples = [sample for sample in samples if sample["time"] > since]
+    return jsonify({'interval': MIC_SAMPLE_INTERVAL, 'capacity': MIC_HISTORY_SIZE, 'samples': samples})
+
+@app.route('/api/stats')
+def stats():
+    """Return internal cache and poller counters for diagnostics."""
+    return jsonify({
+        'detections': get_detection_buffer_stats(),
+        'stations': get_station_stats(),
+        'upstream': get_upstream_stats(),
+        'thumbnail_probes': get_thumbnail_probe_stats(),
+        'thumbnail_cache': get_thumbnail_cache_stats(),
+        'schedule': get_poll_schedule_stats()
+    })
 
 @app.route('/shutdown', methods=['POST'])
 def shutdown():
@@ -513,6 +1807,7 @@ def dismiss_pinned(species_name):
     """Dismiss a pinned species."""
     success = dismiss_pinned_species(species_name)
     if success:
+        request_snapshot_refresh()
         return jsonify({'status': 'success', 'message': f'{species_name} dismissed'})
     else:
         return jsonify({'status': 'error', 'message': f'{species_name} not found in pinned list'}), 404
@@ -521,10 +1816,8 @@ def dismiss_pinned(species_name):
 def dismiss_all_pinned():
     """Dismiss all pinned species."""
     try:
-        pinned = load_pinned_species()
-        for species_name in pinned:
-            pinned[species_name]['dismissed'] = True
-        save_pinned_species(pinned)
+        dismiss_all_pinned_species()
+        request_snapshot_refresh()
         return jsonify({'status': 'success', 'message': 'All pinned species dismissed'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -651,6 +1944,8 @@ def wifi_connect():
                 timeout=30
             )
 
+        request_network_refresh()
+        invalidate_local_ip()
         if result.returncode == 0:
             return jsonify({'status': 'success', 'message': f'Connected to {ssid}'})
         else:
@@ -666,75 +1961,29 @@ def wifi_connect():
 @app.route('/api/wifi/current', methods=['GET'])
 def wifi_current():
     """Get currently connected WiFi network on wlan0."""
-    try:
-        # Get connection status for wlan0 device
-        result = subprocess.run(
-            ['nmcli', '-t', '-f', 'GENERAL.CONNECTION', 'dev', 'show', 'wlan0'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-
-        if result.returncode != 0:
-            return jsonify({'status': 'error', 'message': 'Failed to get current network'}), 500
-
-        # Parse the connection name
-        for line in result.stdout.strip().split('\n'):
-            if line.startswith('GENERAL.CONNECTION:'):
-                connection = line.split(':', 1)[1].strip()
-                if connection and connection != '--':
-                    # Connection name is usually the SSID
-                    return jsonify({'status': 'success', 'ssid': connection})
+    state = get_network_state()
+    if state is None:
+        return jsonify({'status': 'error', 'message': 'Failed to get current network'}), 500
+    # Connection name is usually the SSID
+    return jsonify({'status': 'success', 'ssid': state['wlan0']['connection']})
+
+def fetch_wifi_signal():
+    """Get WiFi signal strength for wlan0 from the network monitor."""
+    state = _network_state
+    if state is None:
+        return {'status': 'error', 'message': 'Failed to check WiFi state', 'signal': 0}
+    if state['wlan0']['state'] != 'connected':
+        return {'status': 'error', 'message': 'WiFi disconnected', 'signal': 0}
+    if state['wlan0']['signal'] is None:
+        return {'status': 'error', 'message': 'No active connection', 'signal': 0}
+    return {'status': 'success', 'signal': state['wlan0']['signal']}
 
-        return jsonify({'status': 'success', 'ssid': None})
-    except Exception as e:
-        print(f"Error getting current WiFi: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/wifi/signal', methods=['GET'])
 def wifi_signal():
     """Get WiFi signal strength for wlan0."""
-    try:
-        # Check if wlan0 is connected
-        state_result = subprocess.run(
-            ['nmcli', '-g', 'GENERAL.STATE', 'dev', 'show', 'wlan0'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-
-        if state_result.returncode != 0:
-            return jsonify({'status': 'error', 'message': 'Failed to check WiFi state', 'signal': 0}), 200
-
-        state = state_result.stdout.strip()
-        # State will be something like "100 (connected)" or "30 (disconnected)"
-        if 'connected' not in state.lower():
-            return jsonify({'status': 'error', 'message': 'WiFi disconnected', 'signal': 0}), 200
-
-        # Get signal strength for active connection on wlan0
-        result = subprocess.run(
-            ['nmcli', '-t', '-f', 'ACTIVE,SIGNAL', 'dev', 'wifi', 'list', 'ifname', 'wlan0'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-
-        if result.returncode != 0:
-            return jsonify({'status': 'error', 'message': 'Failed to get signal strength', 'signal': 0}), 200
-
-        # Find the active connection (marked with 'yes' in ACTIVE field)
-        lines = result.stdout.strip().split('\n')
-        for line in lines:
-            if line.startswith('yes:'):
-                signal_str = line.split(':')[1].strip()
-                if signal_str:
-                    signal = int(signal_str)
-                    return jsonify({'status': 'success', 'signal': signal})
-
-        return jsonify({'status': 'error', 'message': 'No active connection', 'signal': 0}), 200
-    except Exception as e:
-        print(f"Error getting WiFi signal: {e}")
-        return jsonify({'status': 'error', 'message': str(e), 'signal': 0}), 200
+    get_network_state()
+    return jsonify(fetch_wifi_signal()), 200
 
 
 # --- Main Execution ---
@@ -743,5 +1992,9 @@ if __name__ == '__main__':
         print("To build the cache, please run 'python cache_builder.py' directly.")
         sys.exit()
     
+    refresh_offline_deck(force=True)
+    start_detection_poller()
+    start_network_monitor()
+    start_mic_sampler()
     print(f"Starting Flask server on http://0.0.0.0:{SERVER_PORT}")
-    app.run(host='0.0.0.0', port=SERVER_PORT)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=SERVER_PORT, threaded=True)
\ No newline at end of file
@@ -2,11 +2,15 @@ import os
 import re
 import csv
 import requests
-from urllib.parse import urljoin, quote_plus
+from urllib.parse import urljoin, quote_plus, urlencode, urlparse
 from PIL import Image
 from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, as_completed
+import multiprocessing
 import threading
+import json
+import queue
+import io
 import time
 import random
 
@@ -17,9 +21,26 @@ IMAGES_PER_SPECIES = 3
 BIRDNET_API_BASE = "http://localhost:8080"
 MIN_IMAGE_WIDTH = 800
 MIN_IMAGE_HEIGHT = 600
-MAX_WORKERS = 3  # Number of parallel download threads (reduced to avoid triggering rate limits)
-REQUEST_DELAY = 0.5  # Delay between requests in seconds (reduced since we're mimicking browser better)
+DISPLAY_WIDTH = 800  # Cached images are scaled down to just cover this display size
+DISPLAY_HEIGHT = 600
+# Resizing is CPU-bound, so it runs in one process per core this process may use (respects taskset/cpusets)
+RESIZE_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+RESIZE_MANIFEST_FILE = os.path.join(CACHE_DIRECTORY, ".resize_manifest.json")  # Size/mtime/dimensions of checked images
+RESIZE_BENCHMARK_SAMPLE = 24  # Images decoded and resized per executor by --benchmark-resize
+# Concurrent workers per cache-building pipeline stage; the per-host rate limiter keeps request rates in check
+PIPELINE_STAGE_WORKERS = {'search': 3, 'metadata': 3, 'download': 4, 'resize': RESIZE_WORKERS, 'commit': 1}
+PIPELINE_QUEUE_SIZE = 16  # Items buffered between stages before upstream stages block
+PIPELINE_PROGRESS_INTERVAL = 5  # Seconds between pipeline progress lines
+REQUEST_DELAY = 0.5  # Average delay between requests to one host in seconds (sets the token refill rate)
+RATE_LIMIT_BURST = 3  # Requests a host may receive back to back after an idle spell
+MAX_CONCURRENT_PER_HOST = 4  # In-flight requests allowed per host
+RATE_BACKOFF_FACTOR = 0.5  # Request rate multiplier applied to a host on each 429
+RATE_RECOVERY_STEP = 0.05  # Fraction of the full rate regained per successful request after a 429
+MIN_REQUEST_RATE = 0.1  # Floor for a throttled host's request rate (requests per second)
 SKIP_QUALITY_CHECKS = False  # Set to True to skip description checks for faster caching (saves ~50% of page fetches)
+IMAGE_SEARCH_BACKEND = "api"  # "api" (MediaWiki JSON API, one request per search) or "scrape" (MediaSearch HTML + file pages)
+WIKIMEDIA_API_URL = "https://commons.wikimedia.org/w/api.php"
+API_BATCH_SIZE = 50  # Files requested per API search; imageinfo for all of them comes back in the same response
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
@@ -40,8 +61,11 @@ print_lock = threading.Lock()
 
 # Session will be created when needed
 _session = None
-_last_request_time = 0
-_request_lock = threading.Lock()
+
+# Per-host token buckets shared by all workers: host -> {"tokens", "updated", "rate", "paused_until", "slots"}
+_host_limits = {}
+_rate_limit_lock = threading.Lock()
+_rate_limit_stats = {"requests": 0, "waits": 0, "wait_seconds": 0.0, "throttles": 0}
 
 def get_session():
     """Get or create a requests session for connection pooling."""
@@ -51,34 +75,105 @@ def get_session():
         _session.headers.update(HEADERS)
     return _session
 
+def _host_limit(host):
+    """Caller holds _rate_limit_lock."""
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = {
+            "tokens": RATE_LIMIT_BURST, "updated": time.monotonic(), "rate": 1 / REQUEST_DELAY,
+            "paused_until": 0, "slots": threading.BoundedSemaphore(MAX_CONCURRENT_PER_HOST)
+        }
+    return limit
+
+def _refill(limit, now):
+    """Caller holds _rate_limit_lock."""
+    elapsed = now - limit["updated"]
+    if elapsed <= 0:
+        return  # Paused after a 429: "updated" is the end of the pause, so nothing accrues until then
+    limit["tokens"] = min(RATE_LIMIT_BURST, limit["tokens"] + elapsed * limit["rate"])
+    limit["updated"] = now
+
+def _take_token(host):
+    """Block until host's bucket has a token, sleeping only while the lock is released."""
+    while True:
+        with _rate_limit_lock:
+            limit = _host_limit(host)
+            now = time.monotonic()
+            _refill(limit, now)
+            if now < limit["paused_until"]:
+                wait = limit["paused_until"] - now
+            elif limit["tokens"] >= 1:
+                limit["tokens"] -= 1
+                _rate_limit_stats["requests"] += 1
+                return
+            else:
+                wait = (1 - limit["tokens"]) / limit["rate"]
+            _rate_limit_stats["waits"] += 1
+            _rate_limit_stats["wait_seconds"] += wait
+        # Add random variation (up to +30%) to look more human
+        time.sleep(wait * random.uniform(1.0, 1.3))
+
+def _throttle_host(host, retry_after):
+    """Slow a host down for every worker after a 429."""
+    with _rate_limit_lock:
+        limit = _host_limit(host)
+        limit["paused_until"] = max(limit["paused_until"], time.monotonic() + retry_after)
+        limit["rate"] = max(limit["rate"] * RATE_BACKOFF_FACTOR, MIN_REQUEST_RATE)
+        # Resume with a single request when the pause ends, then at the reduced rate, instead of a full burst
+        limit["tokens"] = 1
+        limit["updated"] = limit["paused_until"]
+        _rate_limit_stats["throttles"] += 1
+
+def _recover_host(host):
+    """Regain part of a throttled host's rate after a successful request."""
+    with _rate_limit_lock:
+        limit = _host_limit(host)
+        limit["rate"] = min(1 / REQUEST_DELAY, limit["rate"] + RATE_RECOVERY_STEP / REQUEST_DELAY)
+
+def get_rate_limit_stats():
+    """Report request, wait and throttle counters plus each host's current bucket."""
+    with _rate_limit_lock:
+        now = time.monotonic()
+        hosts = {}
+        for host, limit in _host_limits.items():
+            _refill(limit, now)
+            hosts[host] = {"tokens": round(limit["tokens"], 2), "rate": round(limit["rate"], 3),
+                           "paused_for": round(max(0, limit["paused_until"] - now), 1)}
+        return dict(_rate_limit_stats, wait_seconds=round(_rate_limit_stats["wait_seconds"], 1), hosts=hosts)
+
+def _retry_after_seconds(response, attempt):
+    try:
+        retry_after = int(response.headers.get('Retry-After', 5))
+    except ValueError:
+        retry_after = 5  # HTTP-date form; not worth parsing
+    return min(retry_after, 2 ** attempt * 5)  # Exponential backoff, max based on retry-after
+
 def rate_limited_get(url, timeout=10, max_retries=3):
-    """Make a GET request with rate limiting and retry logic for 429 errors."""
-    global _last_request_time
+    """Make a GET request through the host's token bucket, retrying 429s and transient errors.
 
-    for attempt in range(max_retries):
-        # Rate limiting: ensure minimum delay between requests with natural variation
-        with _request_lock:
-            current_time = time.time()
-            time_since_last = current_time - _last_request_time
-            # Add random variation (±30%) to look more human
-            actual_delay = REQUEST_DELAY * random.uniform(0.7, 1.3)
-            if time_since_last < actual_delay:
-                time.sleep(actual_delay - time_since_last)
-            _last_request_time = time.time()
+    A 429 pauses and slows the host for every worker, not just the thread
+    that received it. The rate then climbs back gradually as requests succeed.
+    """
+    host = urlparse(url).netloc
+    with _rate_limit_lock:
+        slots = _host_limit(host)["slots"]
 
+    for attempt in range(max_retries):
         try:
-            response = get_session().get(url, timeout=timeout)
+            with slots:
+                _take_token(host)
+                response = get_session().get(url, timeout=timeout)
 
-            # Handle 429 rate limit errors with exponential backoff
+            # Handle 429 rate limit errors with a backoff shared by all workers
             if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 5))
-                backoff_time = min(retry_after, 2 ** attempt * 5)  # Exponential backoff, max based on retry-after
+                backoff_time = _retry_after_seconds(response, attempt)
+                _throttle_host(host, backoff_time)
                 with print_lock:
-                    print(f"[RATE LIMIT] 429 error. Waiting {backoff_time}s before retry {attempt + 1}/{max_retries}")
-                time.sleep(backoff_time)
+                    print(f"[RATE LIMIT] 429 error from {host}. Pausing it {backoff_time}s before retry {attempt + 1}/{max_retries}")
                 continue
 
             response.raise_for_status()
+            _recover_host(host)
             return response
 
         except requests.exceptions.RequestException as e:
@@ -123,6 +218,10 @@ def extract_description_text(page_soup):
             return text
     return ""
 
+def get_species_folder_name(common_name):
+    """Return the cache folder name used for a species' images."""
+    return "".join(c for c in common_name if c.isalnum() or c in ' _').rstrip().replace(' ', '_')
+
 def load_species_from_file(filename):
     """Loads a list of bird species from a CSV file (common_name, scientific_name)."""
     if not os.path.exists(filename): return []
@@ -300,8 +399,36 @@ def find_optimal_image_size(page_soup):
 
     return None
 
-def _fetch_and_parse_wikimedia_search(search_query, num_images, existing_urls):
-    """Helper function to perform a single search query on Wikimedia and parse results."""
+def fetch_file_page_attribution(file_page_url, search_query):
+    """Fetch a Wikimedia file page for quality checks and attribution; returns None if the image is unwanted."""
+    page_response = rate_limited_get(file_page_url, timeout=10)
+    page_soup = BeautifulSoup(page_response.text, 'html.parser')
+
+    # Quick description check to filter unwanted images
+    description_text = extract_description_text(page_soup)
+    if description_text:
+        desc_lower = description_text.lower()
+        matched_keyword = next((keyword for keyword in UNWANTED_KEYWORDS if keyword in desc_lower), None)
+        if matched_keyword:
+            with print_lock:
+                print(f"[SKIP] Skipping image because description mentions unwanted keyword '{matched_keyword}' for query '{search_query}'")
+            return None
+
+    # Get attribution
+    attribution = "Wikimedia Commons"
+    author_header = page_soup.find('td', string=re.compile(r'^\s*Author\s*$'))
+    if author_header and author_header.find_next_sibling('td'):
+        attribution_cell = author_header.find_next_sibling('td')
+        attribution = attribution_cell.get_text(strip=True, separator=' ').split('(')[0].strip()
+    formatted_attribution = format_author_name(attribution)
+    return f"© {formatted_attribution}" if formatted_attribution else "© Wikimedia Commons"
+
+def _fetch_and_parse_wikimedia_search(search_query, num_images, existing_urls, defer_metadata=False):
+    """Helper function to perform a single search query on Wikimedia and parse results.
+
+    With defer_metadata, file pages are not fetched. Results instead carry
+    'file_page_url' and attribution None, for fetch_file_page_attribution later.
+    """
     base_url = "https://commons.wikimedia.org"
     search_url = f"{base_url}/w/index.php?search={quote_plus(search_query)}&title=Special:MediaSearch&go=Go&type=image"
     try:
@@ -333,36 +460,19 @@ def _fetch_and_parse_wikimedia_search(search_query, num_images, existing_urls):
                 if candidate_url in existing_urls or candidate_url in seen_urls:
                     continue
 
-                # Fetch file page for attribution and quality checks (unless skipped)
+                # Fetch file page for attribution and quality checks (unless skipped or deferred)
                 if SKIP_QUALITY_CHECKS:
                     # Fast mode: skip quality checks, use generic attribution
                     final_attribution = "© Wikimedia Commons"
+                elif defer_metadata:
+                    final_attribution = None
                 else:
-                    # Fetch page for quality checks and detailed attribution
-                    # Use rate-limited request for file page
-                    page_response = rate_limited_get(file_page_url, timeout=10)
-                    page_soup = BeautifulSoup(page_response.text, 'html.parser')
-
-                    # Quick description check to filter unwanted images
-                    description_text = extract_description_text(page_soup)
-                    if description_text:
-                        desc_lower = description_text.lower()
-                        matched_keyword = next((keyword for keyword in UNWANTED_KEYWORDS if keyword in desc_lower), None)
-                        if matched_keyword:
-                            with print_lock:
-                                print(f"[SKIP] Skipping image because description mentions unwanted keyword '{matched_keyword}' for query '{search_query}'")
-                            continue
-
-                    # Get attribution
-                    attribution = "Wikimedia Commons"
-                    author_header = page_soup.find('td', string=re.compile(r'^\s*Author\s*$'))
-                    if author_header and author_header.find_next_sibling('td'):
-                        attribution_cell = author_header.find_next_sibling('td')
-                        attribution = attribution_cell.get_text(strip=True, separator=' ').split('(')[0].strip()
-                    formatted_attribution = format_author_name(attribution)
-                    final_attribution = f"© {formatted_attribution}" if formatted_attribution else "© Wikimedia Commons"
-
-                image_data.append({'url': candidate_url, 'attribution': final_attribution})
+                    final_attribution = fetch_file_page_attribution(file_page_url, search_query)
+                    if final_attribution is None:
+                        continue
+
+                image_data.append({'url': candidate_url, 'attribution': final_attribution,
+                                   'file_page_url': file_page_url, 'query': search_query})
                 seen_urls.add(candidate_url)
 
             except requests.exceptions.RequestException: continue
@@ -371,7 +481,76 @@ def _fetch_and_parse_wikimedia_search(search_query, num_images, existing_urls):
         print(f"Error scraping Wikimedia for query '{search_query}': {e}")
         return []
 
-def scrape_wikimedia_for_image_data(common_name, scientific_name, num_images, existing_urls):
+def _metadata_text(extmetadata, key):
+    """Plain text of an extmetadata field, which the API returns as HTML."""
+    value = extmetadata.get(key, {}).get('value', '')
+    if not isinstance(value, str) or not value:
+        return ""
+    return BeautifulSoup(value, 'html.parser').get_text(" ", strip=True)
+
+def _fetch_wikimedia_api_search(search_query, num_images, existing_urls):
+    """Search Wikimedia Commons through the MediaWiki API and return image data.
+
+    A generator=search query with prop=imageinfo returns each file's URL,
+    dimensions, description and artist in one response, so no file pages
+    need fetching. Returns None if the API request fails.
+    """
+    params = {
+        'action': 'query', 'format': 'json', 'formatversion': 2,
+        'generator': 'search', 'gsrsearch': f"filetype:bitmap {search_query}", 'gsrnamespace': 6,
+        'gsrlimit': API_BATCH_SIZE,
+        'prop': 'imageinfo', 'iiprop': 'url|size|mime|extmetadata', 'iiurlwidth': 1024,
+        'iiextmetadatafilter': 'ImageDescription|Artist', 'iiextmetadatalanguage': 'en',
+    }
+    try:
+        response = rate_limited_get(f"{WIKIMEDIA_API_URL}?{urlencode(params)}")
+        pages = response.json().get('query', {}).get('pages', [])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error querying the Wikimedia API for '{search_query}': {e}")
+        return None
+
+    image_data = []
+    seen_urls = set()
+    # Pages come back unordered; 'index' is the search rank
+    for page in sorted(pages, key=lambda p: p.get('index', 0)):
+        if len(image_data) >= num_images:
+            break
+        info = (page.get('imageinfo') or [{}])[0]
+        if info.get('mime') not in ('image/jpeg', 'image/png'):
+            continue
+        if info.get('width', 0) < MIN_IMAGE_WIDTH or info.get('height', 0) < MIN_IMAGE_HEIGHT:
+            continue
+        candidate_url = info.get('thumburl') or info.get('url')
+        if not candidate_url or candidate_url in existing_urls or candidate_url in seen_urls:
+            continue
+
+        extmetadata = info.get('extmetadata', {})
+        if not SKIP_QUALITY_CHECKS:
+            desc_lower = _metadata_text(extmetadata, 'ImageDescription').lower()
+            matched_keyword = next((keyword for keyword in UNWANTED_KEYWORDS if keyword in desc_lower), None)
+            if matched_keyword:
+                with print_lock:
+                    print(f"[SKIP] Skipping image because description mentions unwanted keyword '{matched_keyword}' for query '{search_query}'")
+                continue
+        formatted_attribution = format_author_name(_metadata_text(extmetadata, 'Artist').split('(')[0].strip())
+        final_attribution = f"© {formatted_attribution}" if formatted_attribution else "© Wikimedia Commons"
+
+        image_data.append({'url': candidate_url, 'attribution': final_attribution,
+                           'width': info.get('width'), 'height': info.get('height')})
+        seen_urls.add(candidate_url)
+    return image_data
+
+def search_wikimedia(search_query, num_images, existing_urls, defer_metadata=False):
+    """Run one image search with the configured backend, falling back to the HTML scraper if the API fails."""
+    if IMAGE_SEARCH_BACKEND == "api":
+        image_data = _fetch_wikimedia_api_search(search_query, num_images, existing_urls)
+        if image_data is not None:
+            return image_data
+        with print_lock:
+            print(f"{YELLOW}[WARNING] Falling back to MediaSearch scraping for '{search_query}'{NC}")
+    return _fetch_and_parse_wikimedia_search(search_query, num_images, existing_urls, defer_metadata)
+
+def scrape_wikimedia_for_image_data(common_name, scientific_name, num_images, existing_urls, defer_metadata=False):
     """Searches Wikimedia with a priority of queries to find the best quality images."""
     # Use a single, more specific query that's most likely to succeed
     # Scientific name + common name gives best results in one query
@@ -379,49 +558,74 @@ def scrape_wikimedia_for_image_data(common_name, scientific_name, num_images, ex
     collected = []
 
     # Try primary query with higher limit to get all needed images in one search
-    image_data = _fetch_and_parse_wikimedia_search(primary_query, num_images * 2, existing_urls)
-    collected.extend(image_data[:num_images])
+    image_data = search_wikimedia(primary_query, num_images * 2, existing_urls, defer_metadata)
+    # Deferred candidates are unchecked and may still be rejected, so keep them all
+    collected.extend(image_data if defer_metadata else image_data[:num_images])
 
     # Only try fallback queries if we didn't get enough images
     if len(collected) < num_images:
         needed = num_images - len(collected)
         fallback_query = f"{common_name} bird"
-        image_data = _fetch_and_parse_wikimedia_search(fallback_query, needed, existing_urls | {img['url'] for img in collected})
+        image_data = search_wikimedia(fallback_query, needed, existing_urls | {img['url'] for img in collected}, defer_metadata)
         collected.extend(image_data)
 
     return collected
 
-def download_image_and_attribution(image_info, folder_path, file_name_base, existing_urls):
-    """Downloads an image and saves its attribution, skipping if files already exist or cached URL matches."""
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path, exist_ok=True)
-    file_ext = os.path.splitext(image_info['url'].split('(')[0])[-1] or ".jpg"
-    image_file_path = os.path.join(folder_path, f"{file_name_base}{file_ext}")
-    attr_file_path = os.path.join(folder_path, f"{file_name_base}.txt")
-    if image_info['url'] in existing_urls:
-        with print_lock:
-            print(f"[SKIP] URL already cached for {file_name_base}")
-        return
-    if os.path.exists(image_file_path) and os.path.exists(attr_file_path): return
-    try:
-        image_response = rate_limited_get(image_info['url'], timeout=15)
-        with open(image_file_path, 'wb') as f: f.write(image_response.content)
-        with open(attr_file_path, 'w', encoding='utf-8') as f:
-            f.write(f"URL: {image_info['url']}\n")
-            f.write(f"Attribution: {image_info['attribution']}")
-        existing_urls.add(image_info['url'])
-        with print_lock:
-            print(f"Successfully cached {os.path.basename(image_file_path)}")
-    except (requests.exceptions.RequestException, IOError) as e:
-        with print_lock:
-            print(f"Failed to download/save for {file_name_base}. Error: {e}")
+def resize_to_cover(img):
+    """Return img scaled down to just cover DISPLAY_WIDTH x DISPLAY_HEIGHT, or None if it is already small enough.
 
-# --- Main Cache Building Process ---
-def process_species(species_info):
-    """Process a single species - fetch and download images."""
-    common_name, scientific_name = species_info
-    species_folder_name = "".join(c for c in common_name if c.isalnum() or c in ' _').rstrip().replace(' ', '_')
-    species_folder_path = os.path.join(CACHE_DIRECTORY, species_folder_name)
+    img must not be loaded yet: JPEGs are switched to draft mode so the decoder
+    works at the smallest 1/2, 1/4 or 1/8 scale that still covers the target.
+    """
+    w, h = img.size
+    if w <= DISPLAY_WIDTH and h <= DISPLAY_HEIGHT:
+        return None
+    scale = max(DISPLAY_WIDTH / w, DISPLAY_HEIGHT / h)
+    target_size = (int(w * scale), int(h * scale))
+    if img.format == 'JPEG':
+        img.draft(img.mode, target_size)
+    return img.resize(target_size, Image.Resampling.LANCZOS)
+
+def write_file_atomic(path, data):
+    """Write data to path atomically (temp file + fsync + rename), so a power cut never leaves a partial file."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def resize_image_bytes(data):
+    """Resize downloaded image bytes for the display, returning them unchanged if already small enough."""
+    with Image.open(io.BytesIO(data)) as img:
+        image_format = img.format
+        resized_img = resize_to_cover(img)
+        if resized_img is None:
+            return data
+    output = io.BytesIO()
+    resized_img.save(output, format=image_format)
+    return output.getvalue()
+
+def create_resize_pool():
+    """Return a process pool for resizing. Workers are spawned, not forked, as the pipeline forks from a threaded process."""
+    return ProcessPoolExecutor(max_workers=RESIZE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+# --- Cache Building Pipeline ---
+# Species flow through search -> metadata -> download -> resize -> commit. Each
+# stage has its own workers and a bounded inbox, so a slow stage applies
+# backpressure instead of letting work pile up in memory.
+_STOP = object()
+_resize_pool = None  # Process pool used by the resize stage while a build is running
+_resize_pool_lock = threading.Lock()
+
+def _read_cached_urls(species_folder_path):
     existing_urls = set()
     if os.path.isdir(species_folder_path):
         for fname in os.listdir(species_folder_path):
@@ -433,31 +637,173 @@ def process_species(species_info):
                                 existing_urls.add(line.split("URL:", 1)[1].strip())
                 except OSError:
                     continue
+    return existing_urls
 
-    # Check if already cached
+def plan_species(species_info):
+    """Build the pipeline job for a species, or None if its cache is already complete."""
+    common_name, scientific_name = species_info
+    species_folder_name = get_species_folder_name(common_name)
+    species_folder_path = os.path.join(CACHE_DIRECTORY, species_folder_name)
+    current_images = 0
     if os.path.isdir(species_folder_path):
-        images_found = len([f for f in os.listdir(species_folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-        if images_found >= IMAGES_PER_SPECIES:
-            with print_lock:
-                print(f"✓ Cache for '{common_name}' is already complete ({images_found} images). Skipping.")
-            return common_name, True
-
-    # Fetch and download images
-    current_images = len([f for f in os.listdir(species_folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]) if os.path.isdir(species_folder_path) else 0
-    needed = max(IMAGES_PER_SPECIES - current_images, 0)
-    image_infos = scrape_wikimedia_for_image_data(common_name, scientific_name, needed, existing_urls)
-    if not image_infos:
+        current_images = len([f for f in os.listdir(species_folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
+    if current_images >= IMAGES_PER_SPECIES:
         with print_lock:
-            print(f"✗ No images found for '{common_name}'")
-        return common_name, False
-
-    for i, info in enumerate(image_infos):
-        download_image_and_attribution(info, species_folder_path, f"{species_folder_name}_{i+1+current_images}", existing_urls)
+            print(f"✓ Cache for '{common_name}' is already complete ({current_images} images). Skipping.")
+        return None
+    return {
+        "common_name": common_name, "scientific_name": scientific_name,
+        "folder_name": species_folder_name, "folder_path": species_folder_path,
+        "existing_urls": _read_cached_urls(species_folder_path),
+        "current_images": current_images, "needed": IMAGES_PER_SPECIES - current_images,
+        "pending": 0, "cached": 0
+    }
+
+def _search_stage(job):
+    job["candidates"] = scrape_wikimedia_for_image_data(
+        job["common_name"], job["scientific_name"], job["needed"], job["existing_urls"], defer_metadata=True)
+    return [job]
+
+def _accept_candidates(candidates, needed):
+    """Check deferred file pages in order until `needed` candidates are accepted."""
+    accepted = []
+    for info in candidates:
+        if len(accepted) >= needed:
+            break
+        if info['attribution'] is None:
+            try:
+                info['attribution'] = fetch_file_page_attribution(info['file_page_url'], info['query'])
+            except requests.exceptions.RequestException:
+                continue
+            if info['attribution'] is None:
+                continue
+        accepted.append(info)
+    return accepted
+
+def _metadata_stage(job):
+    """Check deferred file pages until enough images are accepted, then emit one item per image.
+
+    If rejections leave the species short, the "<common name> bird" fallback
+    search is checked too, as the non-deferred scraper does. (A species short
+    of raw candidates already ran that search in the search stage.)
+    """
+    accepted = _accept_candidates(job["candidates"], job["needed"])
+    shortfall = job["needed"] - len(accepted)
+    if shortfall > 0 and len(accepted) < len(job["candidates"]):
+        seen_urls = job["existing_urls"] | {info['url'] for info in job["candidates"]}
+        fallback = search_wikimedia(f"{job['common_name']} bird", shortfall * 2, seen_urls, defer_metadata=True)
+        accepted.extend(_accept_candidates(fallback, shortfall))
+    job["pending"] = len(accepted)
+    return [{"job": job, "info": info, "file_name_base": f"{job['folder_name']}_{i+1+job['current_images']}"}
+            for i, info in enumerate(accepted)]
+
+def _download_stage(item):
+    job, info = item["job"], item["info"]
+    file_ext = os.path.splitext(info['url'].split('(')[0])[-1] or ".jpg"
+    item["image_path"] = os.path.join(job["folder_path"], f"{item['file_name_base']}{file_ext}")
+    item["attr_path"] = os.path.join(job["folder_path"], f"{item['file_name_base']}.txt")
+    if info['url'] in job["existing_urls"]:
+        with print_lock:
+            print(f"[SKIP] URL already cached for {item['file_name_base']}")
+        return []
+    if os.path.exists(item["image_path"]) and os.path.exists(item["attr_path"]):
+        return []
+    item["data"] = rate_limited_get(info['url'], timeout=15).content
+    return [item]
+
+def _replace_broken_resize_pool(broken_pool):
+    """Swap a broken resize pool for a fresh one, once however many workers notice it."""
+    global _resize_pool
+    with _resize_pool_lock:
+        if _resize_pool is broken_pool:
+            broken_pool.shutdown(wait=False)
+            _resize_pool = create_resize_pool()
+            with print_lock:
+                print(f"{YELLOW}[WARNING] A resize worker process died; restarted the resize pool{NC}")
+        return _resize_pool
 
-    return common_name, True
+def _resize_stage(item):
+    pool = _resize_pool
+    try:
+        if pool is None:
+            item["data"] = resize_image_bytes(item["data"])
+            return [item]
+        try:
+            item["data"] = pool.submit(resize_image_bytes, item["data"]).result()
+        except BrokenExecutor:
+            # A worker was killed (e.g. by the OOM killer); retry this image once in a fresh pool
+            pool = _replace_broken_resize_pool(pool)
+            item["data"] = pool.submit(resize_image_bytes, item["data"]).result()
+    except (OSError, ValueError, BrokenExecutor) as e:
+        # Not decodable by PIL, or it killed a worker twice; keep the original bytes as the old resize pass did
+        if isinstance(e, BrokenExecutor):
+            _replace_broken_resize_pool(pool)
+        with print_lock:
+            print(f"[WARNING] Could not resize {item['file_name_base']}: {e}")
+    return [item]
+
+def _commit_stage(item):
+    job, info = item["job"], item["info"]
+    os.makedirs(job["folder_path"], exist_ok=True)
+    write_file_atomic(item["image_path"], item["data"])
+    write_file_atomic(item["attr_path"], f"URL: {info['url']}\nAttribution: {info['attribution']}".encode('utf-8'))
+    job["existing_urls"].add(info['url'])
+    job["cached"] += 1
+    with print_lock:
+        print(f"Successfully cached {os.path.basename(item['image_path'])}")
+    return []
+
+PIPELINE_STAGES = [
+    ('search', _search_stage),
+    ('metadata', _metadata_stage),
+    ('download', _download_stage),
+    ('resize', _resize_stage),
+    ('commit', _commit_stage),
+]
+
+def _run_stage_worker(name, func, inbox, outbox, stats, on_finished, stage_state):
+    """Pull items from inbox, push func's results to outbox, and pass _STOP on once every worker is done."""
+    while True:
+        item = inbox.get()
+        if item is _STOP:
+            break
+        started = time.monotonic()
+        try:
+            results = func(item)
+        except Exception as e:
+            # Never let a worker die: the stage would never pass _STOP on
+            results = []
+            with stage_state["lock"]:
+                stats["errors"] += 1
+            with print_lock:
+                label = item.get("file_name_base") or item.get("common_name")
+                print(f"[{name.upper()}] Failed for {label}. Error: {e}")
+        with stage_state["lock"]:
+            stats["processed"] += 1
+            stats["emitted"] += len(results)
+            stats["busy_seconds"] += time.monotonic() - started
+        for result in results:
+            outbox.put(result)
+        if outbox is None or not results:
+            # The item (or a species with nothing left to fetch) ends here
+            on_finished(item, name)
+    with stage_state["lock"]:
+        stage_state["running"] -= 1
+        last = stage_state["running"] == 0
+    if last and outbox is not None:
+        for _ in range(stage_state["next_workers"]):
+            outbox.put(_STOP)
+
+def _format_pipeline_progress(stage_stats, queues, elapsed):
+    parts = []
+    for name, _ in PIPELINE_STAGES:
+        stats = stage_stats[name]
+        parts.append(f"{name} {stats['processed'] / max(elapsed, 0.001):.1f}/s q{queues[name].qsize()}")
+    return " | ".join(parts)
 
 def ensure_cache_is_built():
-    """Checks for and builds the offline image cache with parallel processing."""
+    """Checks for and builds the offline image cache with a staged, backpressured pipeline."""
+    global _resize_pool
     print("--- Checking local image cache... ---")
     bird_species_to_cache = load_species_from_file(SPECIES_FILE)
     if not bird_species_to_cache:
@@ -465,86 +811,217 @@ def ensure_cache_is_built():
         return
 
     total_species = len(bird_species_to_cache)
-    print(f"Processing {total_species} species with {MAX_WORKERS} parallel workers...")
-
-    completed = 0
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Submit all tasks
-        future_to_species = {executor.submit(process_species, species): species for species in bird_species_to_cache}
-
-        # Process completed tasks
-        for future in as_completed(future_to_species):
-            species_name, success = future.result()
-            completed += 1
+    worker_summary = ", ".join(f"{name} x{PIPELINE_STAGE_WORKERS[name]}" for name, _ in PIPELINE_STAGES)
+    print(f"Processing {total_species} species through the pipeline ({worker_summary})...")
+
+    queues = {name: queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for name, _ in PIPELINE_STAGES}
+    stage_stats = {name: {"processed": 0, "emitted": 0, "busy_seconds": 0.0, "errors": 0} for name, _ in PIPELINE_STAGES}
+    progress = {"completed": 0}
+    progress_lock = threading.Lock()
+    started = time.monotonic()
+
+    def finish_species(job, success):
+        with progress_lock:
+            progress["completed"] += 1
+            completed = progress["completed"]
+        with print_lock:
+            if not success:
+                print(f"✗ No images found for '{job['common_name']}'")
+            print(f"[{completed}/{total_species}] Completed: {job['common_name']}")
+
+    def on_finished(item, stage_name):
+        """Account for an item leaving the pipeline, completing its species when nothing is left in flight."""
+        if stage_name in ('search', 'metadata'):
+            # A species that failed its search, or had no acceptable images
+            if item.get("pending", 0) == 0:
+                finish_species(item, False)
+            return
+        job = item["job"]
+        with progress_lock:
+            job["pending"] -= 1
+            done = job["pending"] == 0
+        if done:
+            # Every download, resize or commit for the species may have failed
+            finish_species(job, job["cached"] > 0)
+
+    _resize_pool = create_resize_pool()
+    threads = []
+    for index, (name, func) in enumerate(PIPELINE_STAGES):
+        outbox = queues[PIPELINE_STAGES[index + 1][0]] if index + 1 < len(PIPELINE_STAGES) else None
+        next_workers = PIPELINE_STAGE_WORKERS[PIPELINE_STAGES[index + 1][0]] if outbox is not None else 0
+        stage_state = {"lock": threading.Lock(), "running": PIPELINE_STAGE_WORKERS[name], "next_workers": next_workers}
+        for _ in range(PIPELINE_STAGE_WORKERS[name]):
+            thread = threading.Thread(target=_run_stage_worker, name=f"cache-{name}",
+                                      args=(name, func, queues[name], outbox, stage_stats[name], on_finished, stage_state))
+            thread.start()
+            threads.append(thread)
+
+    stop_reporting = threading.Event()
+    def report_progress():
+        while not stop_reporting.wait(PIPELINE_PROGRESS_INTERVAL):
+            line = _format_pipeline_progress(stage_stats, queues, time.monotonic() - started)
             with print_lock:
-                print(f"[{completed}/{total_species}] Completed: {species_name}")
-
+                print(f"[PIPELINE] {line}")
+    reporter = threading.Thread(target=report_progress, name="cache-progress", daemon=True)
+    reporter.start()
+
+    # Species stage: plan each species and feed the search queue (blocks while it is full)
+    for species in bird_species_to_cache:
+        job = plan_species(species)
+        if job is None:
+            finish_species({"common_name": species[0]}, True)
+        else:
+            queues['search'].put(job)
+    for _ in range(PIPELINE_STAGE_WORKERS['search']):
+        queues['search'].put(_STOP)
+    for thread in threads:
+        thread.join()
+    stop_reporting.set()
+    _resize_pool.shutdown()
+    _resize_pool = None
+
+    elapsed = time.monotonic() - started
+    for name, _ in PIPELINE_STAGES:
+        stats = stage_stats[name]
+        print(f"[PIPELINE] {name}: {stats['processed']} in, {stats['emitted']} out, {stats['errors']} errors, "
+              f"{stats['processed'] / max(elapsed, 0.001):.2f}/s, busy {stats['busy_seconds']:.1f}s")
+    stats = get_rate_limit_stats()
+    print(f"[INFO] Requests: {stats['requests']}, rate-limit waits: {stats['waits']} ({stats['wait_seconds']}s), 429 throttles: {stats['throttles']}")
     print("--- Image cache check complete. ---")
 
-def resize_cached_images():
-    """Resizes large images to fill the target screen size while maintaining aspect ratio (multi-threaded with progress)."""
-    print("--- Checking and resizing large cached images... ---")
-    target_width = 800
-    target_height = 600
+def resize_cached_image(image_path):
+    """Resize one cached image in place. Returns (resized, (width, height)); runs in a worker process."""
+    with Image.open(image_path) as img:
+        image_format = img.format
+        resized_img = resize_to_cover(img)
+        # Skip if already at or below target size
+        if resized_img is None:
+            return False, img.size
+    output = io.BytesIO()
+    resized_img.save(output, format=image_format)
+    write_file_atomic(image_path, output.getvalue())
+    return True, resized_img.size
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_resize_manifest():
+    try:
+        with open(RESIZE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
-    # Collect all image paths first
+def save_resize_manifest(manifest):
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    write_file_atomic(RESIZE_MANIFEST_FILE, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+def list_cached_images():
     image_paths = []
     for root, _, files in os.walk(CACHE_DIRECTORY):
         for file in files:
             if file.lower().endswith(('.png', '.jpg', '.jpeg')):
                 image_paths.append(os.path.join(root, file))
+    return image_paths
+
+def resize_cached_images():
+    """Resizes large images already in the cache to fill the target screen size (one process per core, with progress).
+
+    New downloads are resized before they are written, so this is only needed
+    for caches left at full size by older versions. Files whose size and mtime
+    match the resize manifest were checked on an earlier run and are skipped
+    without being opened.
+    """
+    print("--- Checking and resizing large cached images... ---")
 
+    image_paths = list_cached_images()
     total = len(image_paths)
     if total == 0:
         print("[INFO] No cached images found to resize.")
         return
 
+    manifest = load_resize_manifest()
+    pending = []
+    unchanged = 0
+    for path in image_paths:
+        key = os.path.relpath(path, CACHE_DIRECTORY)
+        entry = manifest.get(key)
+        try:
+            size, mtime_ns = _file_signature(path)
+        except OSError:
+            continue
+        if entry and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+            unchanged += 1
+        else:
+            pending.append(path)
+    # Drop records for images that no longer exist
+    current_keys = {os.path.relpath(path, CACHE_DIRECTORY) for path in image_paths}
+    manifest = {key: entry for key, entry in manifest.items() if key in current_keys}
+    print(f"[INFO] {unchanged} of {total} images unchanged since the last run; checking {len(pending)} with {RESIZE_WORKERS} processes.")
+
     bar_len = 30
     resized = 0
-    skipped = 0
+    skipped = unchanged
     errors = 0
-    completed = 0
-
-    def resize_one(image_path):
-        try:
-            with Image.open(image_path) as img:
-                w, h = img.size
-                # Skip if already at or below target size
-                if w <= target_width and h <= target_height:
-                    return False, image_path
-
-                scale = max(target_width / w, target_height / h)
-                new_width = int(w * scale)
-                new_height = int(h * scale)
-
-                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                resized_img.save(image_path)
-                return True, image_path
-        except Exception:
-            return None, image_path
+    completed = unchanged
 
     def print_progress():
         filled = int(bar_len * (completed / total))
         bar = "#" * filled + "-" * (bar_len - filled)
         print(f"\r[{completed}/{total}] [{bar}] resized:{resized} skipped:{skipped} errors:{errors}", end="", flush=True)
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(resize_one, path): path for path in image_paths}
-        for future in as_completed(futures):
-            result, path = future.result()
-            with print_lock:
+    if pending:
+        with create_resize_pool() as executor:
+            futures = {executor.submit(resize_cached_image, path): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
                 completed += 1
-                if result is True:
-                    resized += 1
-                elif result is False:
-                    skipped += 1
-                else:
+                try:
+                    was_resized, (width, height) = future.result()
+                    size, mtime_ns = _file_signature(path)
+                except Exception:
                     errors += 1
+                else:
+                    manifest[os.path.relpath(path, CACHE_DIRECTORY)] = {
+                        "size": size, "mtime_ns": mtime_ns, "width": width, "height": height}
+                    if was_resized:
+                        resized += 1
+                    else:
+                        skipped += 1
                 print_progress()
+        print()  # newline after progress bar
 
-    print()  # newline after progress bar
+    save_resize_manifest(manifest)
     print(f"--- Image resizing complete. Resized: {resized}, Skipped: {skipped}, Errors: {errors}. ---")
 
+def benchmark_resize_image(image_path):
+    """Decode and resize one image in memory without writing it; used by the resize benchmark."""
+    with Image.open(image_path) as img:
+        resized_img = resize_to_cover(img)
+        if resized_img is None:
+            img.load()
+            return img.size
+        return resized_img.size
+
+def benchmark_resize():
+    """Compare resize throughput for a thread pool and a process pool on a sample of cached images."""
+    image_paths = sorted(list_cached_images(), key=lambda path: os.path.getsize(path), reverse=True)[:RESIZE_BENCHMARK_SAMPLE]
+    if not image_paths:
+        print("[INFO] No cached images found to benchmark.")
+        return
+    print(f"--- Benchmarking resize of {len(image_paths)} images with {RESIZE_WORKERS} workers (nothing is written) ---")
+    for label, make_executor in (("threads", lambda: ThreadPoolExecutor(max_workers=RESIZE_WORKERS)),
+                                 ("processes", create_resize_pool)):
+        with make_executor() as executor:
+            # Warm up so process start-up time is not counted
+            list(executor.map(benchmark_resize_image, image_paths[:RESIZE_WORKERS]))
+            started = time.monotonic()
+            list(executor.map(benchmark_resize_image, image_paths))
+            elapsed = time.monotonic() - started
+        print(f"{label:>9}: {len(image_paths) / max(elapsed, 0.001):.1f} images/sec ({elapsed:.2f}s)")
+
 # This allows the script to be run directly from the command line
 if __name__ == '__main__':
     import sys
@@ -563,7 +1040,20 @@ if __name__ == '__main__':
             print("[ERROR] Failed to update species list")
             sys.exit(1)
 
+    # --scrape forces the MediaSearch HTML scraper instead of the MediaWiki API
+    if '--scrape' in sys.argv:
+        IMAGE_SEARCH_BACKEND = "scrape"
+
+    # --benchmark-resize compares thread and process pools for resizing, without modifying the cache
+    if '--benchmark-resize' in sys.argv:
+        benchmark_resize()
+        sys.exit(0)
+
+    # --resize shrinks images left at full size by older versions of the builder
+    if '--resize' in sys.argv:
+        resize_cached_images()
+        sys.exit(0)
+
     print("--- Starting Offline Image Cache Builder ---")
     ensure_cache_is_built()
-    resize_cached_images()
     print("--- Cache building process complete. ---")
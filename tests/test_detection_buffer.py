@@ -0,0 +1,90 @@
+"""Detection ring buffer behaviour with several BirdNET-Go stations.
+
+Station fetches are replaced by in-memory detection lists, so no server is needed:
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from collections import deque
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import birdnet_display  # noqa: E402
+
+START = datetime(2026, 5, 1, 6, 0, 0)
+
+
+def detection(detection_id, when, name):
+    return {"id": detection_id, "commonName": name, "speciesCode": name.lower().replace(" ", ""),
+            "date": when.strftime("%Y-%m-%d"), "time": when.strftime("%H:%M:%S"), "confidence": 0.8}
+
+
+class TwoStationBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (birdnet_display._stations, birdnet_display._request_station_detections,
+                      birdnet_display._detection_buffer)
+        birdnet_display._stations = {
+            name: birdnet_display._new_station_state({"name": name, "url": f"http://{name.lower()}.invalid/"})
+            for name in ("Busy", "Quiet")
+        }
+        birdnet_display._detection_buffer = deque()
+        birdnet_display._request_station_detections = self.fake_request
+        # Newest first, like /api/v2/detections/recent. The quiet station's birds are all older.
+        self.upstream = {
+            "Busy": [],
+            "Quiet": [detection(5000 - i, START - timedelta(minutes=i + 1), "Noisy Miner") for i in range(50)],
+        }
+        self.limits = {"Busy": [], "Quiet": []}
+
+    def tearDown(self):
+        (birdnet_display._stations, birdnet_display._request_station_detections,
+         birdnet_display._detection_buffer) = self.saved
+
+    def fake_request(self, station, limit):
+        self.limits[station["name"]].append(limit)
+        return self.upstream[station["name"]][:limit]
+
+    def poll(self, busy_new=10):
+        busy = self.upstream["Busy"]
+        for _ in range(busy_new):
+            next_id = len(busy) + 1
+            busy.insert(0, detection(next_id, START + timedelta(seconds=next_id), "Australian Magpie"))
+        return birdnet_display.fetch_new_detections()
+
+    def buffered(self, station_name):
+        return [bird for bird in birdnet_display._detection_buffer if bird['station'] == station_name]
+
+    def test_busy_station_does_not_evict_quiet_station(self):
+        for _ in range(60):
+            self.poll()
+
+        size = birdnet_display.DETECTION_BUFFER_SIZE
+        self.assertEqual(len(self.buffered("Busy")), size)
+        self.assertEqual(len(self.buffered("Quiet")), 50)
+        # The busy station keeps its newest detections
+        self.assertEqual(self.buffered("Busy")[0]['detection_id'], "Busy:600")
+        self.assertEqual(self.buffered("Busy")[-1]['detection_id'], f"Busy:{600 - size + 1}")
+        # ids track exactly what is buffered
+        for name in ("Busy", "Quiet"):
+            self.assertEqual(birdnet_display._stations[name]["ids"], {bird['detection_id'] for bird in self.buffered(name)})
+
+    def test_quiet_station_stays_incremental(self):
+        for _ in range(60):
+            self.poll()
+
+        # One full sync to prime the buffer, then small incremental requests only
+        self.assertEqual(self.limits["Quiet"][0], birdnet_display.DETECTION_BUFFER_SIZE)
+        self.assertEqual(set(self.limits["Quiet"][1:]), {birdnet_display.INCREMENTAL_FETCH_LIMIT})
+        self.assertEqual(birdnet_display._stations["Quiet"]["stats"]["full_syncs"], 1)
+
+    def test_buffer_stays_newest_first(self):
+        for _ in range(30):
+            self.poll()
+        keys = [birdnet_display._detection_sort_key(bird) for bird in birdnet_display._detection_buffer]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
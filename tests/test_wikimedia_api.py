@@ -0,0 +1,120 @@
+"""Run the Wikimedia API search backend against a recorded API response.
+
+A local stand-in server replays tests/fixtures/wikimedia_api_search.json,
+so the filters and attribution parsing can be checked without network access:
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cache_builder  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "wikimedia_api_search.json")
+
+
+class RecordedAPIHandler(BaseHTTPRequestHandler):
+    """Answer /w/api.php with the recorded response and /broken/api.php with non-JSON."""
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        RecordedAPIHandler.requests_seen.append(parse_qs(url.query))
+        if url.path == "/w/api.php":
+            with open(FIXTURE, "rb") as f:
+                body, content_type = f.read(), "application/json; charset=utf-8"
+        else:
+            body, content_type = b"<html>Wikimedia Error</html>", "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WikimediaAPISearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RecordedAPIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.saved = (cache_builder.WIKIMEDIA_API_URL, cache_builder.REQUEST_DELAY, cache_builder.SKIP_QUALITY_CHECKS)
+        cache_builder.WIKIMEDIA_API_URL = f"{cls.base_url}/w/api.php"
+        cache_builder.REQUEST_DELAY = 0.01
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cache_builder.WIKIMEDIA_API_URL, cache_builder.REQUEST_DELAY, cache_builder.SKIP_QUALITY_CHECKS = cls.saved
+
+    def setUp(self):
+        RecordedAPIHandler.requests_seen.clear()
+        cache_builder.SKIP_QUALITY_CHECKS = False
+
+    def search(self, num_images=10, existing_urls=frozenset()):
+        return cache_builder._fetch_wikimedia_api_search("Gymnorhina tibicen Australian Magpie", num_images, set(existing_urls))
+
+    def test_single_batched_request(self):
+        self.search()
+        self.assertEqual(len(RecordedAPIHandler.requests_seen), 1)
+        params = RecordedAPIHandler.requests_seen[0]
+        self.assertEqual(params["generator"], ["search"])
+        self.assertEqual(params["gsrlimit"], [str(cache_builder.API_BATCH_SIZE)])
+        self.assertEqual(params["gsrsearch"], ["filetype:bitmap Gymnorhina tibicen Australian Magpie"])
+        self.assertIn("extmetadata", params["iiprop"][0])
+
+    def test_filters_and_search_rank(self):
+        titles = [os.path.basename(image["url"]) for image in self.search()]
+        # Ranked by 'index'. The egg photo, the 640x480 image, the TIFF and the page without imageinfo are dropped.
+        self.assertEqual(titles, [
+            "1024px-Australian_Magpie_portrait.png",
+            "1024px-Gymnorhina_tibicen_Canberra.jpg",
+            "1024px-Magpie_in_flight.jpg",
+            "1024px-Magpie_warbling.jpg",
+        ])
+
+    def test_keyword_filter_respects_skip_quality_checks(self):
+        cache_builder.SKIP_QUALITY_CHECKS = True
+        titles = [os.path.basename(image["url"]) for image in self.search()]
+        self.assertIn("1024px-Gymnorhina_tibicen_egg_MHNT.jpg", titles)
+
+    def test_artist_html_is_reduced_to_a_name(self):
+        attributions = {os.path.basename(image["url"]): image["attribution"] for image in self.search()}
+        self.assertEqual(attributions["1024px-Australian_Magpie_portrait.png"], "© Toby Hudson")
+        self.assertEqual(attributions["1024px-Gymnorhina_tibicen_Canberra.jpg"], "© JJ Harrison")
+        self.assertEqual(attributions["1024px-Magpie_in_flight.jpg"], "© Wikimedia Commons")
+        # Names longer than 20 characters are cut at a word boundary
+        self.assertEqual(attributions["1024px-Magpie_warbling.jpg"], "© Bernard ...")
+
+    def test_dimensions_come_from_the_original_file(self):
+        first = self.search(num_images=1)
+        self.assertEqual(len(first), 1)
+        self.assertEqual((first[0]["width"], first[0]["height"]), (1600, 1200))
+
+    def test_existing_urls_and_limit(self):
+        existing = {image["url"] for image in self.search() if image["url"].endswith("Australian_Magpie_portrait.png")}
+        self.assertEqual(len(existing), 1)
+        results = self.search(num_images=2, existing_urls=existing)
+        self.assertEqual([os.path.basename(image["url"]) for image in results],
+                         ["1024px-Gymnorhina_tibicen_Canberra.jpg", "1024px-Magpie_in_flight.jpg"])
+
+    def test_unparseable_response_returns_none(self):
+        saved = cache_builder.WIKIMEDIA_API_URL
+        cache_builder.WIKIMEDIA_API_URL = f"{self.base_url}/broken/api.php"
+        try:
+            self.assertIsNone(self.search())
+        finally:
+            cache_builder.WIKIMEDIA_API_URL = saved
+
+
+if __name__ == "__main__":
+    unittest.main()